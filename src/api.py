@@ -1,14 +1,24 @@
 """
 FastAPI后端API接口
 """
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request, WebSocket, WebSocketDisconnect
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Optional
+from src.config import settings
 from src.mcp.mcp_client import MCPClient
+from src.services.prewarm_service import Prewarmer
+from src.utils.cache import get_cache
+from src.utils.circuit_breaker import breaker_stats
+from src.utils.hedging import get_requester
+from src.utils.rate_limiter import get_rate_limiter
+from src.utils.static_assets import load_assets
+import json
 import os
+import threading
+import time
 
 app = FastAPI(title="目的地自主决策智能体", version="1.0.0")
 
@@ -25,7 +35,22 @@ app.add_middleware(
 static_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static")
 if not os.path.exists(static_dir):
     os.makedirs(static_dir, exist_ok=True)
-app.mount("/static", StaticFiles(directory=static_dir), name="static")
+# 顶层静态文件启动时预压缩（gzip/br）并常驻内存
+static_assets = load_assets(static_dir)
+static_files = StaticFiles(directory=static_dir)
+
+
+@app.api_route("/static/{asset_name}", methods=["GET", "HEAD"], include_in_schema=False)
+async def static_asset(asset_name: str, request: Request):
+    """返回预压缩的静态资源，未预加载的文件交给StaticFiles"""
+    asset = static_assets.get(asset_name)
+    if asset is None:
+        return await static_files.get_response(asset_name, request.scope)
+    return asset.response(request)
+
+
+# 子目录中的文件由StaticFiles提供
+app.mount("/static", static_files, name="static")
 
 
 # 请求模型
@@ -35,6 +60,7 @@ class QueryRequest(BaseModel):
     store_name: str  # 连锁店名称
     city: str = "杭州"  # 城市
     preferred_mode: Optional[str] = None  # 偏好交通方式：transit/driving/walking/riding
+    search_mode: Optional[str] = None  # 门店搜索方式：city（全城）/nearby（周边逐圈扩大）
 
 
 # 响应模型
@@ -45,40 +71,113 @@ class QueryResponse(BaseModel):
     alternatives: Optional[list] = None
     all_stores_found: Optional[int] = None
     stores_checked: Optional[list] = None
+    degraded: Optional[bool] = None  # 是否包含地图服务降级时的预估路线
+    candidates: Optional[dict] = None  # 候选门店清洗统计（去重/过滤数量、省下的路线查询）
+    error: Optional[str] = None
+
+
+# 多人集合请求模型
+class GroupQueryRequest(BaseModel):
+    """多人集合查询请求模型"""
+    user_locations: List[str]  # 各参与者的位置
+    store_name: str  # 连锁店名称
+    city: str = "杭州"  # 城市
+    objective: str = "min_sum"  # 目标函数：min_sum/min_max/fair
+    mode: str = "transit"  # 交通方式：transit/driving/walking/riding
+
+
+# 多人集合响应模型
+class GroupQueryResponse(BaseModel):
+    """多人集合查询响应模型"""
+    success: bool
+    recommendation: Optional[dict] = None
+    ranking: Optional[list] = None
+    all_stores_found: Optional[int] = None
+    stores_evaluated: Optional[int] = None
+    stores_pruned: Optional[int] = None
+    approximate: Optional[bool] = None  # 剪枝是否为近似（GROUP_TIGHTEN_BOUND开启时）
+    candidates: Optional[dict] = None
     error: Optional[str] = None
 
 
 # 初始化MCP客户端
 mcp_client = MCPClient()
+_query_log_lock = threading.Lock()
+
+# 缓存预热（依赖查询日志）。memory缓存每个worker独立，各自预热；
+# sqlite缓存多worker共享，用缓存文件旁的文件锁保证只有一个worker预热
+prewarmer = Prewarmer(
+    location_resolver=mcp_client.location_resolver,
+    map_service=mcp_client.map_service,
+    route_service=mcp_client.decision_service.route_service,
+    search_stores=mcp_client.search_stores,
+    log_path=settings.query_log_path if settings.prewarm_enabled else None,
+    interval=settings.prewarm_interval_seconds,
+    log_lines=settings.prewarm_log_lines,
+    top_origins=settings.prewarm_top_origins,
+    top_chains=settings.prewarm_top_chains,
+    top_queries=settings.prewarm_top_queries,
+    lock_path=settings.cache_path + ".prewarm.lock" if settings.cache_backend == "sqlite" else None
+)
+
+
+@app.on_event("startup")
+def start_prewarm():
+    """启动后台缓存预热"""
+    if prewarmer.log_path and settings.upstream_rate_limit <= 0:
+        print("缓存预热已开启但未配置上游限流（UPSTREAM_RATE_LIMIT），预热请求不会为线上请求让行")
+    prewarmer.start()
 
 
-@app.get("/")
-async def index():
+@app.on_event("shutdown")
+def stop_prewarm():
+    prewarmer.stop()
+
+
+def _log_query(request: QueryRequest):
+    """追加一条查询日志（可用 python -m src.loadtest 回放）"""
+    if not settings.query_log_path:
+        return
+    record = {"ts": time.time(), **request.model_dump()}
+    try:
+        with _query_log_lock, open(settings.query_log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+    except OSError as e:
+        print(f"查询日志写入错误: {e}")
+
+
+@app.api_route("/", methods=["GET", "HEAD"])
+async def index(request: Request):
     """返回前端页面"""
-    html_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "static", "index.html")
-    if os.path.exists(html_path):
-        return FileResponse(html_path)
+    asset = static_assets.get("index.html")
+    if asset is not None:
+        return asset.response(request)
     else:
         return {"message": "前端页面未找到，请确保static/index.html存在"}
 
 
 @app.post("/api/query", response_model=QueryResponse)
-async def query_destination(request: QueryRequest):
+async def query_destination(request: QueryRequest,
+                            replay: Optional[str] = Header(None, alias="X-Loadtest-Replay")):
     """
     查询目的地推荐
     
     Args:
         request: 查询请求，包含用户位置、门店名称等
+        replay: 负载测试回放的请求带有 X-Loadtest-Replay 头，不写查询日志
     
     Returns:
         推荐结果，包含最优目的地、路线、备选方案等
     """
+    if not replay:
+        _log_query(request)
     try:
         result = mcp_client.process_request(
             user_location_str=request.user_location,
             store_name=request.store_name,
             city=request.city,
-            preferred_mode=request.preferred_mode
+            preferred_mode=request.preferred_mode,
+            search_mode=request.search_mode
         )
         
         if result.get("success"):
@@ -87,7 +186,9 @@ async def query_destination(request: QueryRequest):
                 recommendation=result.get("recommendation"),
                 alternatives=result.get("alternatives", []),
                 all_stores_found=result.get("all_stores_found", 0),
-                stores_checked=result.get("stores_checked", [])
+                stores_checked=result.get("stores_checked", []),
+                degraded=result.get("degraded", False),
+                candidates=result.get("candidates")
             )
         else:
             return QueryResponse(
@@ -99,10 +200,101 @@ async def query_destination(request: QueryRequest):
         raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
 
 
+@app.post("/api/group_query", response_model=GroupQueryResponse)
+async def group_query(request: GroupQueryRequest):
+    """
+    多人集合推荐：为多个起点选择最合适的门店
+    
+    Args:
+        request: 查询请求，包含各参与者位置、门店名称、目标函数等
+    
+    Returns:
+        推荐门店、各参与者路线及门店排名
+    """
+    if not request.user_locations:
+        raise HTTPException(status_code=400, detail="user_locations不能为空")
+    try:
+        result = mcp_client.process_group_request(
+            user_location_strs=request.user_locations,
+            store_name=request.store_name,
+            city=request.city,
+            objective=request.objective,
+            mode=request.mode
+        )
+        
+        if result.get("success"):
+            return GroupQueryResponse(**result)
+        return GroupQueryResponse(
+            success=False,
+            error=result.get("error", "未知错误")
+        )
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"服务器错误: {str(e)}")
+
+
+@app.websocket("/ws/session")
+async def ranking_session(websocket: WebSocket):
+    """
+    增量排名会话
+    
+    客户端消息：
+        {"type": "start", "user_location": ..., "store_name": ..., "city": ..., "preferred_mode": ...}
+        {"type": "move", "user_location": "经度,纬度"}
+    服务端消息：
+        {"type": "ranking", "ranking": [...]}  首次完整排名
+        {"type": "diff", "changes": [...], "rerouted": n, ...}  位置更新后的排名差异
+        {"type": "error", "error": ...}
+    """
+    await websocket.accept()
+    session = None
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                break
+            try:
+                message = json.loads(frame.get("text") or (frame.get("bytes") or b"").decode("utf-8"))
+                if not isinstance(message, dict):
+                    raise ValueError("消息必须是JSON对象")
+                message_type = message.get("type")
+                if message_type == "start" and message.get("user_location") and message.get("store_name"):
+                    session, reply = await run_in_threadpool(
+                        mcp_client.start_session,
+                        message["user_location"],
+                        message["store_name"],
+                        message.get("city") or "杭州",
+                        message.get("preferred_mode")
+                    )
+                elif message_type == "move" and session is not None and message.get("user_location"):
+                    reply = await run_in_threadpool(
+                        mcp_client.update_session, session, message["user_location"]
+                    )
+                else:
+                    reply = {"type": "error", "error": "无效消息或会话未开始"}
+            except Exception as e:
+                # 单条消息出错只回复错误，不断开会话
+                reply = {"type": "error", "error": f"处理消息时出错: {str(e)}"}
+            await websocket.send_json(reply)
+    except WebSocketDisconnect:
+        pass
+
+
 @app.get("/api/health")
 async def health_check():
     """健康检查"""
-    return {"status": "ok", "message": "服务运行正常"}
+    return {
+        "status": "ok",
+        "message": "服务运行正常",
+        "cache": get_cache().stats(),
+        "location_resolver": mcp_client.location_resolver.stats(),
+        "candidate_filter": mcp_client.candidate_filter.stats(),
+        "upstream": get_requester().stats(),
+        "rate_limiter": get_rate_limiter().stats(),
+        "circuit_breakers": breaker_stats(),
+        "mode_selector": mcp_client.decision_service.route_service.mode_selector.stats(),
+        "prewarm": prewarmer.stats()
+    }
 
 
 if __name__ == "__main__":
@@ -0,0 +1,185 @@
+"""
+批量离线模式 - 对CSV中的每个起点查询最近门店
+
+用法:
+    python -m src.main --bulk <输入.csv> --output <结果.jsonl> [--workers N]
+
+输入CSV需包含表头，列为 user_location、store_name，可选 city、preferred_mode。
+结果逐行写入JSONL，并定期写检查点；任务中断后用相同命令重新运行即可从断点继续。
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import tempfile
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Optional
+from src.mcp.mcp_client import MCPClient
+
+
+class Checkpoint:
+    """
+    断点信息：已完成的输入行数与对应的输出文件偏移
+
+    结果按输入顺序写出，因此"前N行已完成"即可完整描述进度；
+    恢复时把输出文件截断到记录的偏移，丢弃检查点之后写了一半的结果。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rows_done = 0
+        self.output_offset = 0
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self.rows_done = data.get("rows_done", 0)
+            self.output_offset = data.get("output_offset", 0)
+
+    def save(self, rows_done: int, output_offset: int):
+        """原子写入检查点"""
+        self.rows_done = rows_done
+        self.output_offset = output_offset
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"rows_done": rows_done, "output_offset": output_offset}, f)
+        os.replace(tmp_path, self.path)
+
+
+class BulkRunner:
+    """流式读取CSV、并行处理、按序写出结果"""
+
+    def __init__(self, client: MCPClient, workers: int = 8,
+                 default_city: str = "杭州", checkpoint_every: int = 100):
+        self.client = client
+        self.workers = workers
+        self.default_city = default_city
+        self.checkpoint_every = checkpoint_every
+        # 在途任务上限，保证内存占用与输入规模无关
+        self.window = workers * 4
+
+    def process_row(self, row_number: int, row: Dict[str, str]) -> Dict[str, Any]:
+        """处理单行，返回紧凑结果"""
+        user_location = (row.get("user_location") or "").strip()
+        store_name = (row.get("store_name") or "").strip()
+        record: Dict[str, Any] = {
+            "row": row_number,
+            "user_location": user_location,
+            "store_name": store_name
+        }
+        if not user_location or not store_name:
+            record.update(success=False, error="缺少user_location或store_name")
+            return record
+
+        result = self.client.process_request(
+            user_location_str=user_location,
+            store_name=store_name,
+            city=(row.get("city") or "").strip() or self.default_city,
+            preferred_mode=(row.get("preferred_mode") or "").strip() or None
+        )
+        if not result.get("success"):
+            record.update(success=False, error=result.get("error", "未知错误"))
+            return record
+
+        destination = result["recommendation"]["destination"]
+        route = result["recommendation"]["route"]
+        record.update(
+            success=True,
+            destination=destination["name"],
+            address=destination["address"],
+            longitude=destination["coordinates"]["longitude"],
+            latitude=destination["coordinates"]["latitude"],
+            traffic_mode=route["traffic_mode"],
+            duration=route["duration_seconds"],
+            distance=route["distance_meters"],
+            estimated=route.get("estimated", False)
+        )
+        return record
+
+    def run(self, input_path: str, output_path: str, checkpoint_path: str) -> Dict[str, int]:
+        """
+        执行批量任务（支持断点续跑）
+
+        Returns:
+            {"processed": 本次处理行数, "succeeded": 成功行数, "rows_done": 累计完成行数}
+        """
+        checkpoint = Checkpoint(checkpoint_path)
+        output_size = os.path.getsize(output_path) if os.path.exists(output_path) else None
+        if checkpoint.rows_done and (output_size is None or output_size < checkpoint.output_offset):
+            # 输出文件被删除或截短，检查点记录的结果已不存在，只能从头开始
+            print(f"输出文件缺失或短于检查点记录的偏移（{checkpoint.output_offset} 字节），从头开始处理",
+                  file=sys.stderr)
+            checkpoint.rows_done = checkpoint.output_offset = 0
+            output_size = None
+        if checkpoint.rows_done:
+            print(f"从检查点恢复：已完成 {checkpoint.rows_done} 行", file=sys.stderr)
+
+        processed = succeeded = 0
+        rows_done = checkpoint.rows_done
+        pending: "deque[Future]" = deque()
+
+        mode = "r+b" if output_size is not None else "wb"
+        with open(input_path, "r", encoding="utf-8-sig", newline="") as infile, \
+                open(output_path, mode) as outfile, \
+                ThreadPoolExecutor(max_workers=self.workers) as executor:
+            outfile.truncate(checkpoint.output_offset)
+            outfile.seek(checkpoint.output_offset)
+
+            def write_oldest():
+                nonlocal processed, succeeded, rows_done
+                record = pending.popleft().result()
+                outfile.write(json.dumps(record, ensure_ascii=False,
+                                         separators=(",", ":")).encode("utf-8") + b"\n")
+                processed += 1
+                succeeded += 1 if record.get("success") else 0
+                rows_done += 1
+                if rows_done % self.checkpoint_every == 0:
+                    self._commit(outfile, checkpoint, rows_done)
+
+            for row_number, row in enumerate(csv.DictReader(infile)):
+                if row_number < checkpoint.rows_done:
+                    continue
+                pending.append(executor.submit(self.process_row, row_number, row))
+                if len(pending) >= self.window:
+                    write_oldest()
+
+            while pending:
+                write_oldest()
+            self._commit(outfile, checkpoint, rows_done)
+
+        return {"processed": processed, "succeeded": succeeded, "rows_done": rows_done}
+
+    def _commit(self, outfile, checkpoint: Checkpoint, rows_done: int):
+        """结果落盘后再推进检查点"""
+        outfile.flush()
+        os.fsync(outfile.fileno())
+        checkpoint.save(rows_done, outfile.tell())
+        print(f"已完成 {rows_done} 行", file=sys.stderr)
+
+
+def main(argv: Optional[list] = None):
+    """批量模式入口"""
+    parser = argparse.ArgumentParser(prog="python -m src.main --bulk",
+                                     description="批量查询最近门店（可断点续跑）")
+    parser.add_argument("input", help="输入CSV文件")
+    parser.add_argument("--output", required=True, help="结果JSONL文件")
+    parser.add_argument("--checkpoint", default=None, help="检查点文件（默认：<output>.ckpt）")
+    parser.add_argument("--workers", type=int, default=8, help="并行数")
+    parser.add_argument("--city", default="杭州", help="CSV未提供city时使用的城市")
+    parser.add_argument("--checkpoint-every", type=int, default=100, help="每完成多少行写一次检查点")
+    args = parser.parse_args(argv)
+
+    runner = BulkRunner(
+        MCPClient(),
+        workers=args.workers,
+        default_city=args.city,
+        checkpoint_every=args.checkpoint_every
+    )
+    summary = runner.run(
+        input_path=args.input,
+        output_path=args.output,
+        checkpoint_path=args.checkpoint or f"{args.output}.ckpt"
+    )
+    print(json.dumps(summary, ensure_ascii=False))
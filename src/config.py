@@ -2,7 +2,7 @@
 配置文件管理
 """
 from pydantic_settings import BaseSettings
-from typing import Optional
+from typing import List, Optional
 
 
 class Settings(BaseSettings):
@@ -10,10 +10,78 @@ class Settings(BaseSettings):
     # 高德地图API配置
     amap_api_key: str = ""
     amap_base_url: str = "https://restapi.amap.com/v3"
+    request_timeout_seconds: float = 10.0
+    
+    # 对冲请求配置：超过端点观测分位数仍未返回时补发请求，补发数不超过主请求的 budget_ratio 倍
+    hedge_enabled: bool = True
+    hedge_percentile: float = 0.95
+    hedge_budget_ratio: float = 0.1
+    hedge_default_delay_seconds: float = 1.0
+    # 对冲线程池大小：在途上游调用超过该数时，新调用直接在调用线程执行（不对冲），不会排队
+    hedge_max_workers: int = 256
+    
+    # 熔断配置：端点连续失败次数达到阈值后熔断，冷却后在后台探测恢复
+    breaker_failure_threshold: int = 5
+    breaker_cooldown_seconds: float = 30.0
+    
+    # 上游限流（每进程令牌桶，默认 <=0 不限流）：开启后对冲请求同样占用令牌，
+    # 预热等后台任务不能动用为线上请求保留的令牌
+    upstream_rate_limit: float = 0.0
+    upstream_burst: int = 30
+    background_reserve_ratio: float = 0.5
+    
+    # 门店搜索方式：city 全城关键词搜索 / nearby 以用户为中心逐圈扩大的周边搜索
+    store_search_mode: str = "city"
+    nearby_radii: List[int] = [1000, 3000, 8000, 20000, 50000]
+    nearby_min_results: int = 5
+    nearby_max_results: int = 10
+    
+    # 多人集合：是否用实测速度收紧剪枝下界（更少路线查询，但结果为近似）
+    group_tighten_bound: bool = False
+    
+    # 候选门店清洗：合并相距小于merge_radius（米）的POI；名称不含品牌名且与关键词的匹配比例低于
+    # name_score的POI、以及指定类型编码前缀的POI被过滤
+    # （15交通设施、18道路附属设施、19地名地址、97室内设施、99通行设施）
+    candidate_merge_radius: float = 50.0
+    candidate_name_score: float = 0.5
+    candidate_excluded_types: List[str] = ["15", "18", "19", "97", "99"]
     
     # MCP服务配置
     mcp_server_url: Optional[str] = None
-    
+
+    # 缓存配置（memory：每个worker独立缓存；sqlite：多worker共享的本地文件缓存）
+    cache_backend: str = "memory"
+    cache_path: str = "data/cache.sqlite3"
+    cache_max_entries: int = 10000
+    cache_ttl_seconds: int = 86400
+    route_cache_ttl_seconds: int = 1800
+
+    # 本地地名词典（由过往地理编码结果积累）
+    gazetteer_path: str = "data/gazetteer.json"
+
+    # 查询日志（JSONL，供负载测试回放使用；为空则不记录）
+    query_log_path: Optional[str] = None
+
+    # 缓存预热：启动时及每隔interval秒，从查询日志最近log_lines行中取热门起点、(门店, 城市)与查询组合，
+    # 重新查询并刷新缓存；interval需短于route_cache_ttl_seconds，热门路线才不会在两轮之间过期。
+    # 默认关闭：预热的后台优先级依赖上游限流（upstream_rate_limit），开启时建议同时配置限流
+    prewarm_enabled: bool = False
+    prewarm_interval_seconds: float = 1500.0
+    prewarm_log_lines: int = 20000
+    prewarm_top_origins: int = 50
+    prewarm_top_chains: int = 20
+    prewarm_top_queries: int = 20
+
+    # 交通方式筛选模型（python -m src.train_mode_model 生成）
+    # mode_model_mode：off 关闭 / shadow 只评估不跳过 / on 跳过胜出概率低于阈值的方式
+    mode_model_path: Optional[str] = None
+    mode_model_mode: str = "shadow"
+    mode_model_threshold: float = 0.05
+    # on模式下仍查询全部交通方式的比例（继续积累训练数据与影子评估）
+    mode_model_explore_rate: float = 0.05
+    # 交通方式胜出记录（JSONL，模型训练数据；为空则不记录）
+    outcome_log_path: Optional[str] = None
+
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
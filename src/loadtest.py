@@ -0,0 +1,247 @@
+"""
+负载测试工具 - 回放查询日志
+
+用法:
+    python -m src.loadtest <日志文件.jsonl> [--target inprocess|http://host:port]
+                           [--concurrency N] [--rate QPS | --replay-timing --speedup X]
+                           [--limit N] [--report report.json]
+
+日志每行一个JSON对象，字段为 user_location、store_name、city、preferred_mode（可选 search_mode），
+可选的 ts（Unix时间戳）用于按原始到达间隔回放。
+回放前一次性读入日志；回放的请求带 X-Loadtest-Replay 头，服务端不会把它们再写进查询日志，
+因此可以直接回放服务正在写入的 QUERY_LOG_PATH。
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+
+def read_log(path: str, limit: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    """逐行读取查询日志，跳过无法解析的行"""
+    count = 0
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if limit is not None and count >= limit:
+                return
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("user_location") and record.get("store_name"):
+                count += 1
+                yield record
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """已排序序列的分位数"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(q * len(sorted_values)))
+    return sorted_values[index]
+
+
+class InProcessTarget:
+    """直接调用FastAPI应用的查询接口（不经过网络）"""
+
+    def __init__(self):
+        from src import api
+        self.api = api
+
+    def query(self, record: Dict[str, Any]) -> bool:
+        request = self.api.QueryRequest(
+            user_location=record["user_location"],
+            store_name=record["store_name"],
+            city=record.get("city") or "杭州",
+            preferred_mode=record.get("preferred_mode"),
+            search_mode=record.get("search_mode")
+        )
+        response = asyncio.run(self.api.query_destination(request, replay="1"))
+        return response.success
+
+    def upstream_calls(self) -> int:
+        from src.utils.hedging import get_requester
+        return _count_upstream(get_requester().stats())
+
+
+class HttpTarget:
+    """通过HTTP调用已启动的服务"""
+
+    def __init__(self, base_url: str, timeout: float = 60.0):
+        import requests
+        self.requests = requests
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+
+    def query(self, record: Dict[str, Any]) -> bool:
+        response = self.requests.post(
+            f"{self.base_url}/api/query",
+            json={
+                "user_location": record["user_location"],
+                "store_name": record["store_name"],
+                "city": record.get("city") or "杭州",
+                "preferred_mode": record.get("preferred_mode"),
+                "search_mode": record.get("search_mode")
+            },
+            headers={"X-Loadtest-Replay": "1"},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return bool(response.json().get("success"))
+
+    def upstream_calls(self) -> Optional[int]:
+        """从健康检查接口读取上游调用计数（多worker时只反映命中的那个worker）"""
+        try:
+            data = self.requests.get(f"{self.base_url}/api/health", timeout=self.timeout).json()
+            return _count_upstream(data.get("upstream", {}))
+        except Exception:
+            return None
+
+
+def _count_upstream(stats: Dict[str, Dict[str, int]]) -> int:
+    """上游调用总数（主请求+对冲请求）"""
+    return sum(item.get("requests", 0) + item.get("hedged", 0) for item in stats.values())
+
+
+class LoadTest:
+    """查询日志回放"""
+
+    def __init__(self, target, concurrency: int = 8, rate: Optional[float] = None,
+                 replay_timing: bool = False, speedup: float = 1.0):
+        self.target = target
+        self.concurrency = concurrency
+        self.rate = rate
+        self.replay_timing = replay_timing
+        self.speedup = speedup
+        self.latencies: List[float] = []
+        self.succeeded = 0
+        self.failed = 0  # 接口正常返回但 success=false
+        self.errors = 0  # 异常、HTTP错误
+        self._lock = threading.Lock()
+
+    def _run_one(self, record: Dict[str, Any], scheduled_at: float):
+        """执行单次查询，耗时从计划发送时刻算起（开环模式下包含排队时间）"""
+        try:
+            ok = self.target.query(record)
+        except Exception as e:
+            ok = None
+            print(f"请求错误: {e}", file=sys.stderr)
+        latency = time.monotonic() - scheduled_at
+        with self._lock:
+            self.latencies.append(latency)
+            if ok is None:
+                self.errors += 1
+            elif ok:
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    def _arrivals(self, records: Iterable[Dict[str, Any]], start: float):
+        """生成 (记录, 计划发送时刻)；闭环模式下计划时刻为None"""
+        next_at = start
+        first_ts = None
+        for record in records:
+            if self.replay_timing and record.get("ts") is not None:
+                ts = float(record["ts"])
+                first_ts = ts if first_ts is None else first_ts
+                yield record, start + (ts - first_ts) / self.speedup
+            elif self.rate:
+                # 泊松到达
+                yield record, next_at
+                next_at += random.expovariate(self.rate)
+            else:
+                yield record, None
+
+    def run(self, records: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """回放日志并返回报告"""
+        upstream_before = self.target.upstream_calls()
+        start = time.monotonic()
+        # 闭环模式用信号量把在途请求限制在并发数以内
+        slots = threading.Semaphore(self.concurrency)
+
+        def closed_loop(record):
+            try:
+                self._run_one(record, time.monotonic())
+            finally:
+                slots.release()
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for record, scheduled_at in self._arrivals(records, start):
+                if scheduled_at is None:
+                    slots.acquire()
+                    executor.submit(closed_loop, record)
+                    continue
+                delay = scheduled_at - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._run_one, record, scheduled_at)
+
+        elapsed = time.monotonic() - start
+        upstream_after = self.target.upstream_calls()
+        return self._report(elapsed, upstream_before, upstream_after)
+
+    def _report(self, elapsed: float, upstream_before: Optional[int],
+                upstream_after: Optional[int]) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+        total = len(latencies)
+        upstream = None
+        if upstream_before is not None and upstream_after is not None and total:
+            upstream = round((upstream_after - upstream_before) / total, 2)
+        return {
+            "queries": total,
+            "elapsed_seconds": round(elapsed, 2),
+            "throughput_qps": round(total / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                name: round(percentile(latencies, q) * 1000, 1)
+                for name, q in (("p50", 0.5), ("p90", 0.9), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))
+            },
+            "success_rate": round(self.succeeded / total, 4) if total else 0.0,
+            "failure_rate": round(self.failed / total, 4) if total else 0.0,
+            "error_rate": round(self.errors / total, 4) if total else 0.0,
+            "upstream_calls_per_query": upstream
+        }
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="回放查询日志进行负载测试")
+    parser.add_argument("log", help="查询日志（JSONL）")
+    parser.add_argument("--target", default="inprocess",
+                        help="inprocess（默认，进程内调用）或服务地址，如 http://localhost:8000")
+    parser.add_argument("--concurrency", type=int, default=8, help="最大并发数")
+    parser.add_argument("--rate", type=float, default=None, help="开环模式：平均到达速率（次/秒）")
+    parser.add_argument("--replay-timing", action="store_true", help="按日志中的ts间隔回放")
+    parser.add_argument("--speedup", type=float, default=1.0, help="时间压缩倍数（配合--replay-timing）")
+    parser.add_argument("--limit", type=int, default=None, help="最多回放的查询数")
+    parser.add_argument("--report", default=None, help="报告输出文件（JSON）")
+    args = parser.parse_args()
+
+    target = InProcessTarget() if args.target == "inprocess" else HttpTarget(args.target)
+    load_test = LoadTest(
+        target,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        replay_timing=args.replay_timing,
+        speedup=args.speedup
+    )
+    # 先读完再回放，回放期间日志文件被追加也不会影响回放的范围
+    records = list(read_log(args.log, limit=args.limit))
+    report = load_test.run(records)
+
+    output = json.dumps(report, ensure_ascii=False, indent=2)
+    print(output)
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(output)
+
+
+if __name__ == "__main__":
+    main()
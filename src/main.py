@@ -9,8 +9,15 @@ from src.mcp.mcp_client import MCPClient
 
 def main():
     """主函数"""
+    if len(sys.argv) > 1 and sys.argv[1] == "--bulk":
+        # 批量模式：python main.py --bulk <输入.csv> --output <结果.jsonl>
+        from src.bulk import main as bulk_main
+        bulk_main(sys.argv[2:])
+        return
+    
     if len(sys.argv) < 3:
         print("用法: python main.py <用户位置> <连锁店名称> [城市] [交通方式]")
+        print("      python main.py --bulk <输入.csv> --output <结果.jsonl> [--workers N]")
         print("示例: python main.py '浙江大学紫金港校区' '联想电脑专卖店' '杭州' 'transit'")
         sys.exit(1)
     
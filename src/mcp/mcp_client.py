@@ -1,11 +1,15 @@
 """
 MCP服务客户端
 """
-from typing import Dict, Any, Optional
-from src.models.destination import Location, Recommendation, RouteInfo
+from typing import Dict, Any, List, Optional, Tuple
+from src.config import settings
+from src.models.destination import Location, Recommendation, RouteInfo, GroupRecommendation
 from src.services.map_service import MapService
+from src.services.route_service import RouteService
+from src.services.candidate_filter import CandidateFilter
 from src.services.decision_service import DecisionService
-from src.utils.helpers import parse_location_string
+from src.services.location_resolver import LocationResolver
+from src.services.session_service import RankingSession
 
 
 class MCPClient:
@@ -14,11 +18,18 @@ class MCPClient:
     def __init__(self):
         self.map_service = MapService()
         self.decision_service = DecisionService()
+        self.location_resolver = LocationResolver(self.map_service)
+        self.candidate_filter = CandidateFilter(
+            merge_radius=settings.candidate_merge_radius,
+            min_name_score=settings.candidate_name_score,
+            excluded_type_prefixes=tuple(settings.candidate_excluded_types)
+        )
     
     def process_request(self, user_location_str: str, 
                       store_name: str, 
                       city: str = "杭州",
-                      preferred_mode: Optional[str] = None) -> Dict[str, Any]:
+                      preferred_mode: Optional[str] = None,
+                      search_mode: Optional[str] = None) -> Dict[str, Any]:
         """
         处理用户请求
         
@@ -27,6 +38,7 @@ class MCPClient:
             store_name: 连锁店名称
             city: 城市名称
             preferred_mode: 偏好的交通方式
+            search_mode: 门店搜索方式（city/nearby），默认取配置store_search_mode
         
         Returns:
             推荐结果字典
@@ -40,10 +52,10 @@ class MCPClient:
                     "error": f"无法解析用户位置: {user_location_str}"
                 }
             
-            # 2. 搜索门店
-            store_locations = self.map_service.search_places(
-                keywords=store_name,
-                city=city
+            # 2. 搜索门店（清洗后每个门店查询全部默认交通方式）
+            store_locations, candidates = self.search_stores(
+                store_name, city, user_location, search_mode,
+                calls_per_store=len(RouteService.DEFAULT_TRAFFIC_MODES)
             )
             
             if not store_locations:
@@ -56,11 +68,14 @@ class MCPClient:
             recommendation = self.decision_service.get_recommendation(
                 user_location=user_location,
                 store_locations=store_locations,
-                preferred_mode=preferred_mode
+                preferred_mode=preferred_mode,
+                city=city
             )
             
             # 4. 格式化返回结果
-            return self._format_response(recommendation, store_locations)
+            response = self._format_response(recommendation, store_locations)
+            response["candidates"] = candidates
+            return response
             
         except Exception as e:
             return {
@@ -68,24 +83,162 @@ class MCPClient:
                 "error": f"处理请求时出错: {str(e)}"
             }
     
-    def _get_user_location(self, location_str: str) -> Optional[Location]:
-        """获取用户位置"""
-        # 先尝试地理编码
-        location = self.map_service.geocode(location_str)
-        if location:
-            return location
-        
-        # 如果失败，尝试解析坐标
-        parsed = parse_location_string(location_str)
-        if parsed.get("longitude") and parsed.get("latitude"):
-            return Location(
-                name=parsed["name"],
-                longitude=parsed["longitude"],
-                latitude=parsed["latitude"],
-                address=parsed["address"]
+    def process_group_request(self, user_location_strs: List[str],
+                              store_name: str,
+                              city: str = "杭州",
+                              objective: str = "min_sum",
+                              mode: str = "transit") -> Dict[str, Any]:
+        """
+        处理多人集合请求
+        
+        Args:
+            user_location_strs: 各参与者的位置（地址或坐标）
+            store_name: 连锁店名称
+            city: 城市名称
+            objective: 目标函数（min_sum/min_max/fair）
+            mode: 交通方式
+        
+        Returns:
+            推荐结果字典
+        """
+        try:
+            # 1. 解析所有起点
+            origins = []
+            for location_str in user_location_strs:
+                location = self._get_user_location(location_str)
+                if not location:
+                    return {
+                        "success": False,
+                        "error": f"无法解析用户位置: {location_str}"
+                    }
+                origins.append(location)
+            
+            # 2. 搜索门店（每个门店最多需要每个起点各一次路线查询）
+            store_locations, candidates = self.candidate_filter.clean(
+                store_name,
+                self.map_service.search_places(keywords=store_name, city=city),
+                calls_per_store=len(origins)
             )
+            self.candidate_filter.record(candidates)
+            
+            if not store_locations:
+                return {
+                    "success": False,
+                    "error": f"未找到 {store_name} 在 {city} 的门店"
+                }
+            
+            # 3. 获取推荐
+            recommendation = self.decision_service.get_group_recommendation(
+                origins=origins,
+                store_locations=store_locations,
+                objective=objective,
+                mode=mode,
+                tighten_bound=settings.group_tighten_bound
+            )
+            
+            # 4. 格式化返回结果
+            response = self._format_group_response(recommendation, user_location_strs, store_locations)
+            response["candidates"] = candidates
+            return response
+            
+        except Exception as e:
+            return {
+                "success": False,
+                "error": f"处理请求时出错: {str(e)}"
+            }
+    
+    def start_session(self, user_location_str: str,
+                      store_name: str,
+                      city: str = "杭州",
+                      preferred_mode: Optional[str] = None) -> Tuple[Optional[RankingSession], Dict[str, Any]]:
+        """
+        创建增量排名会话并返回首次完整排名
+        
+        Args:
+            user_location_str: 用户位置（地址或坐标）
+            store_name: 连锁店名称
+            city: 城市名称
+            preferred_mode: 指定时只比较该交通方式，否则比较公交、驾车、步行
+        
+        Returns:
+            (会话, 推送给客户端的消息)；失败时会话为None
+        """
+        user_location = self._get_user_location(user_location_str)
+        if not user_location:
+            return None, {"type": "error", "error": f"无法解析用户位置: {user_location_str}"}
+        
+        traffic_modes = [preferred_mode] if preferred_mode else RouteService.DEFAULT_TRAFFIC_MODES
+        store_locations, candidates = self.search_stores(
+            store_name, city, user_location, calls_per_store=len(traffic_modes)
+        )
+        if not store_locations:
+            return None, {"type": "error", "error": f"未找到 {store_name} 在 {city} 的门店"}
+        
+        session = RankingSession(
+            route_service=self.decision_service.route_service,
+            store_locations=store_locations,
+            traffic_modes=traffic_modes
+        )
+        message = session.start(user_location)
+        message["candidates"] = candidates
+        return session, message
+    
+    def update_session(self, session: RankingSession, user_location_str: str) -> Dict[str, Any]:
+        """会话内位置更新，返回排名差异"""
+        user_location = self._get_user_location(user_location_str)
+        if not user_location:
+            return {"type": "error", "error": f"无法解析用户位置: {user_location_str}"}
+        return session.update(user_location)
+    
+    def search_stores(self, store_name: str, city: str, user_location: Location,
+                      search_mode: Optional[str] = None,
+                      calls_per_store: int = 1,
+                      force_refresh: bool = False,
+                      record_stats: bool = True) -> Tuple[List[Location], Dict[str, int]]:
+        """
+        搜索门店并清洗候选：全城关键词搜索，或以用户为中心逐圈扩大的周边搜索
         
-        return None
+        Args:
+            store_name: 连锁店名称
+            city: 城市名称
+            user_location: 用户位置（周边搜索的中心）
+            search_mode: 门店搜索方式（city/nearby），默认取配置store_search_mode
+            calls_per_store: 每个门店需要的路线查询次数，用于统计省下的查询
+            force_refresh: 跳过缓存重新查询并刷新缓存（缓存预热使用）
+            record_stats: 是否计入清洗统计（后台预热不计入）
+        
+        Returns:
+            (清洗后的门店, 清洗统计)
+        """
+        stores, candidates = [], None
+        if (search_mode or settings.store_search_mode) == "nearby":
+            stores, candidates = self.candidate_filter.clean(
+                store_name,
+                self.map_service.search_places_nearby(
+                    keywords=store_name,
+                    center=user_location,
+                    city=city,
+                    min_results=settings.nearby_min_results,
+                    max_results=settings.nearby_max_results,
+                    force_refresh=force_refresh
+                ),
+                calls_per_store=calls_per_store
+            )
+        # 周边没有该城市的门店（或清洗后一个不剩），如用户不在所选城市时，退回全城搜索
+        if not stores:
+            stores, candidates = self.candidate_filter.clean(
+                store_name,
+                self.map_service.search_places(keywords=store_name, city=city,
+                                               force_refresh=force_refresh),
+                calls_per_store=calls_per_store
+            )
+        if record_stats:
+            self.candidate_filter.record(candidates)
+        return stores, candidates
+    
+    def _get_user_location(self, location_str: str) -> Optional[Location]:
+        """获取用户位置（坐标 → 地名词典 → 远程地理编码）"""
+        return self.location_resolver.resolve(location_str)
     
     def _format_response(self, recommendation: Recommendation,
                         all_stores: list) -> Dict[str, Any]:
@@ -115,7 +268,8 @@ class MCPClient:
                     "distance_formatted": self._format_distance(best.distance),
                     "cost": best.cost,
                     "details": route_details,
-                    "summary": best.route_detail
+                    "summary": best.route_detail,
+                    "estimated": best.estimated
                 },
                 "comparison_summary": recommendation.comparison_summary
             },
@@ -125,10 +279,12 @@ class MCPClient:
                     "address": alt.destination.address,
                     "traffic_mode": self._get_mode_name_cn(alt.traffic_mode),
                     "duration": self._format_duration(alt.duration),
-                    "distance": self._format_distance(alt.distance)
+                    "distance": self._format_distance(alt.distance),
+                    "estimated": alt.estimated
                 }
                 for alt in recommendation.alternatives
             ],
+            "degraded": best.estimated or any(alt.estimated for alt in recommendation.alternatives),
             "all_stores_found": len(all_stores),
             "stores_checked": [
                 {
@@ -141,6 +297,57 @@ class MCPClient:
         
         return response
     
+    def _format_group_response(self, recommendation: GroupRecommendation,
+                               user_location_strs: List[str],
+                               all_stores: list) -> Dict[str, Any]:
+        """格式化多人集合响应结果"""
+        best = recommendation.best
+        
+        return {
+            "success": True,
+            "recommendation": {
+                "destination": {
+                    "name": best.destination.name,
+                    "address": best.destination.address,
+                    "coordinates": {
+                        "longitude": best.destination.longitude,
+                        "latitude": best.destination.latitude
+                    }
+                },
+                "objective": recommendation.objective,
+                "traffic_mode": recommendation.traffic_mode,
+                "traffic_mode_cn": self._get_mode_name_cn(recommendation.traffic_mode),
+                "total_duration_formatted": self._format_duration(best.total_duration),
+                "max_duration_formatted": self._format_duration(best.max_duration),
+                "routes": [
+                    {
+                        "origin": origin,
+                        "duration_seconds": route.duration,
+                        "duration_formatted": self._format_duration(route.duration),
+                        "distance_formatted": self._format_distance(route.distance),
+                        "summary": route.route_detail,
+                        "estimated": route.estimated
+                    }
+                    for origin, route in zip(user_location_strs, recommendation.best_routes)
+                ]
+            },
+            "ranking": [
+                {
+                    "destination": item.destination.name,
+                    "address": item.destination.address,
+                    "score": item.score,
+                    "total_duration": self._format_duration(item.total_duration),
+                    "max_duration": self._format_duration(item.max_duration),
+                    "estimated": item.estimated
+                }
+                for item in recommendation.ranking
+            ],
+            "all_stores_found": len(all_stores),
+            "stores_evaluated": recommendation.stores_evaluated,
+            "stores_pruned": recommendation.stores_pruned,
+            "approximate": recommendation.approximate
+        }
+    
     def _format_route_details(self, route: RouteInfo) -> list:
         """格式化路线详细步骤"""
         if not route.steps:
@@ -150,52 +357,30 @@ class MCPClient:
         if route.traffic_mode == "transit":
             # 公共交通路线
             for step in route.steps:
-                if isinstance(step, dict):
-                    if step.get("walking"):
-                        walk = step["walking"]
-                        # 确保distance是数字类型（API可能返回字符串）
-                        distance = walk.get('distance', 0)
-                        try:
-                            distance = float(distance) if distance else 0
-                        except (ValueError, TypeError):
-                            distance = 0
-                        details.append({
-                            "type": "walking",
-                            "instruction": f"步行 {distance/1000:.1f}公里",
-                            "distance": distance,
-                            "duration": walk.get('duration', 0)
-                        })
-                    elif step.get("bus"):
-                        bus = step["bus"]
-                        buslines = bus.get("buslines", [])
-                        if buslines:
-                            bl = buslines[0]
-                            details.append({
-                                "type": "bus",
-                                "instruction": f"乘坐 {bl.get('name', '公交')}",
-                                "departure": bl.get('departure_stop', {}).get('name', ''),
-                                "arrival": bl.get('arrival_stop', {}).get('name', ''),
-                                "duration": bl.get('duration', 0)
-                            })
-                    elif step.get("railway"):
-                        rail = step["railway"]
-                        details.append({
-                            "type": "subway",
-                            "instruction": f"乘坐 {rail.get('name', '地铁')}",
-                            "departure": rail.get('departure_stop', {}).get('name', ''),
-                            "arrival": rail.get('arrival_stop', {}).get('name', ''),
-                            "duration": rail.get('duration', 0)
-                        })
-        else:
-            # 其他交通方式
-            for i, step in enumerate(route.steps[:10], 1):  # 最多显示10步
-                if isinstance(step, dict):
+                if step.type == "walking":
+                    details.append({
+                        "type": "walking",
+                        "instruction": f"步行 {step.distance/1000:.1f}公里",
+                        "distance": step.distance,
+                        "duration": step.duration
+                    })
+                else:
                     details.append({
-                        "step": i,
-                        "instruction": step.get("instruction", "")[:50],
-                        "distance": step.get("distance", 0),
-                        "duration": step.get("duration", 0)
+                        "type": step.type,
+                        "instruction": f"乘坐 {step.name}",
+                        "departure": step.departure or "",
+                        "arrival": step.arrival or "",
+                        "duration": step.duration
                     })
+        else:
+            # 其他交通方式（解析时已截取前10步）
+            for i, step in enumerate(route.steps, 1):
+                details.append({
+                    "step": i,
+                    "instruction": step.instruction or "",
+                    "distance": step.distance,
+                    "duration": step.duration
+                })
         
         return details
     
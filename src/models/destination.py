@@ -11,6 +11,19 @@ class Location(BaseModel):
     longitude: float  # 经度
     latitude: float  # 纬度
     address: Optional[str] = None  # 详细地址
+    poi_id: Optional[str] = None  # 地图POI ID（门店搜索结果才有）
+    type_code: Optional[str] = None  # 地图POI类型编码（多个以|分隔）
+
+
+class RouteStep(BaseModel):
+    """路线步骤（只保留展示用到的字段）"""
+    type: str  # 步骤类型：walking/bus/subway（公交方案）或 step（其他方式）
+    name: Optional[str] = None  # 公交/地铁线路名称
+    instruction: Optional[str] = None  # 导航指引
+    departure: Optional[str] = None  # 上车站
+    arrival: Optional[str] = None  # 下车站
+    distance: float = 0  # 距离（米）
+    duration: int = 0  # 时间（秒）
 
 
 class RouteInfo(BaseModel):
@@ -21,7 +34,8 @@ class RouteInfo(BaseModel):
     traffic_mode: str  # 交通方式：driving/walking/transit/riding
     route_detail: Optional[str] = None  # 路线详情
     cost: Optional[float] = None  # 费用（元）
-    steps: Optional[List[dict]] = None  # 详细步骤
+    steps: Optional[List[RouteStep]] = None  # 详细步骤
+    estimated: bool = False  # 是否为地图服务不可用时的直线距离预估结果
 
 
 class Recommendation(BaseModel):
@@ -31,3 +45,25 @@ class Recommendation(BaseModel):
     alternatives: List[RouteInfo] = []  # 备选方案
     comparison_summary: Optional[str] = None  # 比较摘要
 
+
+
+class StoreScore(BaseModel):
+    """多人集合场景下单个门店的评分"""
+    destination: Location  # 门店
+    score: float  # 目标函数值（秒，越小越好）
+    durations: List[int]  # 各起点到该门店的时间（秒），与起点顺序一致
+    total_duration: int  # 总时间（秒）
+    max_duration: int  # 最远者时间（秒）
+    estimated: bool = False  # 是否包含预估路线
+
+
+class GroupRecommendation(BaseModel):
+    """多人集合推荐结果"""
+    objective: str  # 目标函数：min_sum/min_max/fair
+    traffic_mode: str  # 交通方式
+    best: StoreScore  # 最优门店
+    best_routes: List[RouteInfo]  # 各起点到最优门店的路线
+    ranking: List[StoreScore] = []  # 已精确计算的门店排名（含最优）
+    stores_evaluated: int = 0  # 精确查询了路线的门店数
+    stores_pruned: int = 0  # 通过下界剪枝跳过的门店数
+    approximate: bool = False  # 是否用了近似下界剪枝（被跳过的门店中可能有更优者）
@@ -0,0 +1,176 @@
+"""
+候选门店清洗 - 在规划路线前去重并过滤无关POI
+
+1. 类型过滤：去掉交通设施、地名地址、室内设施等类型编码的POI
+2. 名称过滤：名称既不包含品牌名、与关键词的匹配度也偏低的POI（其他品牌的同类门店等）
+3. 空间去重：用空间哈希把相距很近的POI合并为一个（同一门店被重复收录）
+"""
+import math
+import threading
+from typing import Dict, List, Tuple
+from src.models.destination import Location
+from src.services.location_resolver import normalize_place_name
+from src.utils.helpers import haversine_distance
+
+
+# 关键词末尾的通用品类词，去掉后剩下品牌名（如"联想电脑专卖店"→"联想"）
+GENERIC_SUFFIXES = (
+    "专卖店", "旗舰店", "体验店", "专营店", "直营店", "授权店", "服务中心", "服务站",
+    "便利店", "超市", "商场", "门店", "分店", "电脑", "手机", "数码", "家电",
+    "餐厅", "火锅", "咖啡", "药房", "药店", "店"
+)
+
+
+def brand_core(keyword: str) -> str:
+    """去掉关键词末尾的通用品类词，得到品牌名（至少保留2个字符）"""
+    core = normalize_place_name(keyword)
+    stripped = True
+    while stripped:
+        stripped = False
+        for suffix in GENERIC_SUFFIXES:
+            if core.endswith(suffix) and len(core) - len(suffix) >= 2:
+                core = core[:-len(suffix)]
+                stripped = True
+                break
+    return core
+
+
+def longest_common_substring(a: str, b: str) -> int:
+    """两个字符串最长公共子串的长度"""
+    if not a or not b:
+        return 0
+    best = 0
+    previous = [0] * (len(b) + 1)
+    for char_a in a:
+        current = [0] * (len(b) + 1)
+        for j, char_b in enumerate(b, 1):
+            if char_a == char_b:
+                current[j] = previous[j - 1] + 1
+                best = max(best, current[j])
+        previous = current
+    return best
+
+
+class CandidateFilter:
+    """
+    候选门店清洗器
+
+    Args:
+        merge_radius: 相距小于该距离（米）的POI视为同一门店
+        min_name_score: 名称不含品牌名时，与关键词的最长公共子串占关键词长度的最低比例
+        excluded_type_prefixes: 需要排除的AMap类型编码前缀
+    """
+
+    def __init__(self, merge_radius: float = 50.0, min_name_score: float = 0.5,
+                 excluded_type_prefixes: Tuple[str, ...] = ()):
+        self.merge_radius = merge_radius
+        self.min_name_score = min_name_score
+        self.excluded_type_prefixes = tuple(excluded_type_prefixes)
+        self._lock = threading.Lock()
+        self.counters = {
+            "queries": 0,
+            "candidates_before": 0,
+            "candidates_after": 0,
+            "route_calls_saved": 0
+        }
+
+    def clean(self, keyword: str, stores: List[Location],
+              calls_per_store: int = 1) -> Tuple[List[Location], Dict[str, int]]:
+        """
+        清洗候选门店（保持原有顺序）。只计算不计数，统计由调用方用record()计入
+
+        Args:
+            keyword: 搜索关键词
+            stores: 搜索得到的候选门店
+            calls_per_store: 每个门店需要的路线查询次数，用于统计省下的查询
+
+        Returns:
+            (保留的门店, {"before", "after", "type_filtered", "name_filtered", "merged", "route_calls_saved"})
+        """
+        stats = {"before": len(stores), "type_filtered": 0, "name_filtered": 0, "merged": 0}
+
+        typed = [store for store in stores if not self._excluded_type(store)]
+        stats["type_filtered"] = len(stores) - len(typed)
+
+        named = self._filter_names(keyword, typed)
+        stats["name_filtered"] = len(typed) - len(named)
+
+        kept = self._merge_nearby([store for store, _ in named])
+        stats["merged"] = len(named) - len(kept)
+        stats["after"] = len(kept)
+        stats["route_calls_saved"] = (len(stores) - len(kept)) * calls_per_store
+        return kept, stats
+
+    def record(self, stats: Dict[str, int]):
+        """把一次查询的清洗结果计入累计统计"""
+        with self._lock:
+            self.counters["queries"] += 1
+            self.counters["candidates_before"] += stats["before"]
+            self.counters["candidates_after"] += stats["after"]
+            self.counters["route_calls_saved"] += stats["route_calls_saved"]
+
+    def stats(self) -> Dict:
+        """累计清洗统计"""
+        with self._lock:
+            counters = dict(self.counters)
+        before = counters["candidates_before"]
+        return {
+            **counters,
+            "removal_rate": round(1 - counters["candidates_after"] / before, 4) if before else 0.0
+        }
+
+    def _excluded_type(self, store: Location) -> bool:
+        return bool(store.type_code) and any(
+            code.startswith(self.excluded_type_prefixes)
+            for code in store.type_code.split("|")
+        )
+
+    def _filter_names(self, keyword: str, stores: List[Location]) -> List[Tuple[Location, float]]:
+        """
+        按名称过滤：名称包含品牌名的一律保留，其余按与关键词的最长公共子串占
+        关键词长度的比例过滤；一个都不匹配时（如关键词是别名）不做过滤
+        """
+        normalized_keyword = normalize_place_name(keyword)
+        if not normalized_keyword:
+            return [(store, 1.0) for store in stores]
+        core = brand_core(keyword)
+        scored = []
+        for store in stores:
+            name = normalize_place_name(store.name)
+            if core in name:
+                score = 1.0
+            else:
+                score = longest_common_substring(normalized_keyword, name) / len(normalized_keyword)
+            scored.append((store, score))
+        kept = [(store, score) for store, score in scored if score >= self.min_name_score]
+        return kept if kept else scored
+
+    def _merge_nearby(self, stores: List[Location]) -> List[Location]:
+        """
+        空间哈希去重：按merge_radius大小的网格分桶，只与相邻9个格子内的已保留POI比较
+        """
+        if self.merge_radius <= 0:
+            return list(stores)
+        kept: List[Location] = []
+        grid: Dict[Tuple[int, int], List[Location]] = {}
+        for store in stores:
+            cell = self._cell(store)
+            neighbours = (
+                other
+                for dx in (-1, 0, 1) for dy in (-1, 0, 1)
+                for other in grid.get((cell[0] + dx, cell[1] + dy), [])
+            )
+            if any(haversine_distance(store.longitude, store.latitude,
+                                      other.longitude, other.latitude) < self.merge_radius
+                   for other in neighbours):
+                continue
+            grid.setdefault(cell, []).append(store)
+            kept.append(store)
+        return kept
+
+    def _cell(self, store: Location) -> Tuple[int, int]:
+        """经纬度换算为米后所在的网格"""
+        meters_per_degree_lat = 110540.0
+        meters_per_degree_lon = 111320.0 * math.cos(math.radians(store.latitude))
+        return (int(math.floor(store.longitude * meters_per_degree_lon / self.merge_radius)),
+                int(math.floor(store.latitude * meters_per_degree_lat / self.merge_radius)))
@@ -1,8 +1,10 @@
 """
 决策推荐服务
 """
-from typing import List, Optional
-from src.models.destination import Location, RouteInfo, Recommendation
+from typing import Callable, Dict, List, Optional, Tuple
+from src.models.destination import (
+    Location, RouteInfo, Recommendation, StoreScore, GroupRecommendation
+)
 from src.services.route_service import RouteService
 from src.utils.helpers import format_duration, format_distance
 
@@ -10,12 +12,19 @@ from src.utils.helpers import format_duration, format_distance
 class DecisionService:
     """决策推荐服务类"""
     
+    # 多人集合目标函数中fair的权重：score = (1 - w) * 平均时间 + w * 最远者时间
+    FAIRNESS_WEIGHT = 0.5
+    
+    # 多人集合近似剪枝（tighten_bound=True时）：下界速度取实测最快等效速度（直线距离/时间）的倍数
+    SPEED_BOUND_MARGIN = 1.2
+    
     def __init__(self):
         self.route_service = RouteService()
     
     def get_recommendation(self, user_location: Location,
                           store_locations: List[Location],
-                          preferred_mode: Optional[str] = None) -> Recommendation:
+                          preferred_mode: Optional[str] = None,
+                          city: Optional[str] = None) -> Recommendation:
         """
         获取推荐结果
         
@@ -23,11 +32,14 @@ class DecisionService:
             user_location: 用户位置
             store_locations: 门店位置列表
             preferred_mode: 偏好的交通方式（可选）
+            city: 城市（可选，用于交通方式筛选）
         """
         # 获取所有路线
         all_routes = self.route_service.get_all_routes(
             user_location=user_location,
-            store_locations=store_locations
+            store_locations=store_locations,
+            city=city,
+            preferred_mode=preferred_mode
         )
         
         if not all_routes:
@@ -67,6 +79,123 @@ class DecisionService:
             comparison_summary=summary
         )
     
+    def get_group_recommendation(self, origins: List[Location],
+                                 store_locations: List[Location],
+                                 objective: str = "min_sum",
+                                 mode: str = "transit",
+                                 top_k: int = 3,
+                                 tighten_bound: bool = False) -> GroupRecommendation:
+        """
+        多人集合推荐：为多个起点选择最合适的门店
+        
+        用直线距离除以乐观速度算出每个门店目标值的下界（不调用上游），按下界
+        从小到大分批精确查询路线；当剩余门店的下界已不优于当前第top_k名时停止，
+        其余门店不再查询。乐观速度取交通方式的速度上限，剪枝结果与全部查询一致。
+        
+        驾车、步行每个门店只需一次距离测量请求，公交每个门店需要 起点数 次路线请求；
+        最优门店的路线详情在排名确定后补充查询。
+        
+        tighten_bound为True时，改用本次查询实测的最快等效速度（留出SPEED_BOUND_MARGIN
+        余量）收紧下界，剪枝更多，但明显快于已查询门店的路线（如地铁直达）可能被误剪，
+        结果标记为近似（approximate）。
+        
+        Args:
+            origins: 各参与者的起点
+            store_locations: 门店位置列表
+            objective: 目标函数
+                - min_sum: 总时间最短
+                - min_max: 最远者时间最短
+                - fair: 兼顾平均时间与最远者时间
+            mode: 交通方式
+            top_k: 精确排名的门店数（最优 + 备选）
+            tighten_bound: 是否用实测速度收紧下界（近似剪枝）
+        """
+        score_fn = self._get_objective(objective)
+        if not origins:
+            raise ValueError("至少需要一个起点")
+        
+        route_service = self.route_service
+        distances = [
+            [route_service.straight_distance(origin, store) for origin in origins]
+            for store in store_locations
+        ]
+        static_speed = route_service.OPTIMISTIC_SPEEDS.get(mode, route_service.OPTIMISTIC_SPEEDS["transit"])
+        speed = static_speed
+        observed_speed = 0.0
+        
+        # 每批查询的门店数，使一批的上游请求数接近并发上限（距离测量每个门店一次请求）
+        if mode in route_service.map_service.DISTANCE_TYPES:
+            batch_size = route_service.MAX_WORKERS
+        else:
+            batch_size = max(1, route_service.MAX_WORKERS // len(origins))
+        ranking: List[Tuple[StoreScore, int]] = []  # (评分, 门店下标)，按评分升序
+        routes_by_store: Dict[int, List[RouteInfo]] = {}
+        remaining = set(range(len(store_locations)))
+        
+        while remaining:
+            bounds = sorted(
+                (score_fn([distance / speed for distance in distances[index]]), index)
+                for index in remaining
+            )
+            threshold = ranking[top_k - 1][0].score if len(ranking) >= top_k else float("inf")
+            batch = [index for bound, index in bounds[:batch_size] if bound < threshold]
+            if not batch:
+                break
+            remaining.difference_update(batch)
+            
+            matrix = route_service.get_route_matrix(
+                origins, [store_locations[index] for index in batch], mode
+            )
+            for index, column in zip(batch, matrix):
+                if any(route is None for route in column):
+                    continue  # 有参与者无法到达
+                durations = [route.duration for route in column]
+                ranking.append((StoreScore(
+                    destination=store_locations[index],
+                    score=round(score_fn(durations), 1),
+                    durations=durations,
+                    total_duration=sum(durations),
+                    max_duration=max(durations),
+                    estimated=any(route.estimated for route in column)
+                ), index))
+                routes_by_store[index] = column
+                observed_speed = max([observed_speed] + [
+                    distance / route.duration
+                    for distance, route in zip(distances[index], column)
+                    if route.duration > 0 and not route.estimated
+                ])
+            ranking.sort(key=lambda item: item[0].score)
+            if tighten_bound and observed_speed:
+                # 用本次查询实测的最快等效速度收紧下界（留出余量），不再保证下界成立
+                speed = min(static_speed, observed_speed * self.SPEED_BOUND_MARGIN)
+        
+        if not ranking:
+            raise ValueError("未找到所有参与者都可到达的门店")
+        
+        best, best_index = ranking[0]
+        return GroupRecommendation(
+            objective=objective,
+            traffic_mode=mode,
+            best=best,
+            best_routes=route_service.add_route_details(origins, routes_by_store[best_index]),
+            ranking=[item for item, _ in ranking[:top_k]],
+            stores_evaluated=len(store_locations) - len(remaining),
+            stores_pruned=len(remaining),
+            approximate=tighten_bound and bool(remaining)
+        )
+    
+    def _get_objective(self, objective: str) -> Callable[[List[float]], float]:
+        """获取多人集合的目标函数"""
+        weight = self.FAIRNESS_WEIGHT
+        objectives = {
+            "min_sum": sum,
+            "min_max": max,
+            "fair": lambda values: (1 - weight) * sum(values) / len(values) + weight * max(values)
+        }
+        if objective not in objectives:
+            raise ValueError(f"不支持的目标函数: {objective}（可选：{'/'.join(objectives)}）")
+        return objectives[objective]
+    
     def _generate_summary(self, best_route: RouteInfo,
                          alternatives: List[RouteInfo],
                          comparison: dict) -> str:
@@ -75,7 +204,8 @@ class DecisionService:
             f"推荐目的地：{best_route.destination.name}",
             f"地址：{best_route.destination.address}",
             f"交通方式：{self._get_mode_name(best_route.traffic_mode)}",
-            f"预计时间：{format_duration(best_route.duration)}",
+            f"预计时间：{format_duration(best_route.duration)}" +
+            ("（预估，地图服务暂不可用）" if best_route.estimated else ""),
             f"距离：{format_distance(best_route.distance)}"
         ]
         
@@ -0,0 +1,204 @@
+"""
+用户位置解析服务（本地优先）
+
+解析顺序：
+1. 坐标识别：输入本身就是 "经度,纬度" 时直接使用
+2. 地名词典：命中过往地理编码结果中的地标（校区、车站、商场等）
+3. 远程地理编码：调用地图API，成功结果回写地名词典
+4. 文本内嵌坐标：兜底从文本中提取坐标
+"""
+import atexit
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import unicodedata
+from typing import Dict, Optional
+from src.config import settings
+from src.models.destination import Location
+from src.services.map_service import MapService
+from src.utils.helpers import parse_coordinates, parse_location_string
+
+
+# 归一化时去掉的空白与标点
+_NORMALIZE_PATTERN = re.compile(r"[\s\-_·,，.。()（）\[\]【】\"'“”]+")
+
+
+def normalize_place_name(name: str) -> str:
+    """地名归一化：全角转半角、忽略大小写、去掉空白与标点"""
+    name = unicodedata.normalize("NFKC", name).lower()
+    return _NORMALIZE_PATTERN.sub("", name)
+
+
+class Gazetteer:
+    """
+    本地地名词典
+
+    以归一化地名为键保存坐标，持久化到JSON文件。新条目先记在内存中，由后台线程
+    每隔flush_interval秒批量写盘（进程退出时再写一次），请求线程不做文件IO。
+    写文件时先合并磁盘上其他进程写入的条目，再通过临时文件+rename原子替换。
+    """
+
+    def __init__(self, path: str, max_entries: int = 50000, flush_interval: float = 5.0):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._entries: Dict[str, dict] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        # 同一时间只有一个线程写文件
+        self._save_lock = threading.Lock()
+        self._flusher: Optional[threading.Thread] = None
+        self._entries.update(self._load())
+
+    def _load(self) -> Dict[str, dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (OSError, ValueError) as e:
+            print(f"地名词典读取错误: {e}")
+            return {}
+
+    def lookup(self, name: str) -> Optional[Location]:
+        """按归一化地名查找"""
+        key = normalize_place_name(name)
+        if not key:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        return Location(name=name, longitude=entry["longitude"],
+                        latitude=entry["latitude"], address=entry.get("address"))
+
+    def add(self, name: str, location: Location):
+        """记录一条地名（稍后批量写入文件）"""
+        key = normalize_place_name(name)
+        if not key:
+            return
+        entry = {
+            "longitude": location.longitude,
+            "latitude": location.latitude,
+            "address": location.address
+        }
+        with self._lock:
+            if self._entries.get(key) == entry or len(self._entries) >= self.max_entries:
+                return
+            self._entries[key] = entry
+            self._dirty = True
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name="gazetteer-flush",
+                                                 daemon=True)
+                self._flusher.start()
+                atexit.register(self.flush)
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
+
+    def flush(self):
+        """把内存中的新条目合并磁盘内容后原子写入"""
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                self._dirty = False
+                snapshot = dict(self._entries)
+            merged = self._load()
+            merged.update(snapshot)
+            directory = os.path.dirname(os.path.abspath(self.path))
+            try:
+                os.makedirs(directory, exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    json.dump(merged, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+            except OSError as e:
+                print(f"地名词典写入错误: {e}")
+                with self._lock:
+                    self._dirty = True
+                return
+            # 收下其他进程写入的条目
+            with self._lock:
+                for key, entry in merged.items():
+                    self._entries.setdefault(key, entry)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+class LocationResolver:
+    """用户位置解析器，各阶段分别统计命中次数"""
+
+    STAGES = ("coordinates", "gazetteer", "geocode", "embedded_coordinates", "unresolved")
+
+    def __init__(self, map_service: MapService, gazetteer: Optional[Gazetteer] = None):
+        self.map_service = map_service
+        self.gazetteer = gazetteer or Gazetteer(settings.gazetteer_path)
+        self.counters = {stage: 0 for stage in self.STAGES}
+        self._lock = threading.Lock()
+
+    def resolve(self, location_str: str, record_stats: bool = True) -> Optional[Location]:
+        """
+        解析用户位置，无法解析时返回None
+
+        Args:
+            location_str: 用户位置（地址或坐标）
+            record_stats: 是否计入命中统计（后台预热不计入）
+        """
+        location_str = location_str.strip()
+
+        coords = parse_coordinates(location_str)
+        if coords:
+            self._hit("coordinates", record_stats)
+            return Location(name=location_str, longitude=coords[0],
+                            latitude=coords[1], address=location_str)
+
+        location = self.gazetteer.lookup(location_str)
+        if location:
+            self._hit("gazetteer", record_stats)
+            return location
+
+        location = self.map_service.geocode(location_str)
+        if location:
+            self._hit("geocode", record_stats)
+            self.gazetteer.add(location_str, location)
+            return location
+
+        parsed = parse_location_string(location_str)
+        if parsed.get("longitude") and parsed.get("latitude"):
+            self._hit("embedded_coordinates", record_stats)
+            return Location(
+                name=parsed["name"],
+                longitude=parsed["longitude"],
+                latitude=parsed["latitude"],
+                address=parsed["address"]
+            )
+
+        self._hit("unresolved", record_stats)
+        return None
+
+    def _hit(self, stage: str, record_stats: bool = True):
+        if not record_stats:
+            return
+        with self._lock:
+            self.counters[stage] += 1
+
+    def stats(self) -> Dict:
+        """各阶段命中统计"""
+        with self._lock:
+            counters = dict(self.counters)
+        total = sum(counters.values())
+        local = counters["coordinates"] + counters["gazetteer"]
+        return {
+            "counters": counters,
+            "local_hit_rate": round(local / total, 4) if total else 0.0,
+            "gazetteer_entries": len(self.gazetteer)
+        }
@@ -2,54 +2,126 @@
 地图API服务封装（高德地图）
 """
 import requests
-from typing import List, Optional, Dict
+from typing import List, Optional, Dict, Tuple
 from src.config import settings
-from src.models.destination import Location
+from src.models.destination import Location, RouteStep
+from src.utils.cache import get_cache, make_key
+from src.utils.circuit_breaker import CircuitBreaker, get_breaker
+from src.utils.hedging import get_requester
+from src.utils.rate_limiter import get_rate_limiter
+
+
+class UpstreamError(Exception):
+    """地图API返回了服务端错误（配额、限流、引擎故障等）"""
 
 
 class MapService:
     """地图服务类"""
     
+    # 各交通方式对应的路线规划API端点
+    ROUTE_ENDPOINTS = {
+        "transit": "direction/transit/integrated",
+        "driving": "direction/driving",
+        "walking": "direction/walking",
+        "riding": "direction/bicycling"
+    }
+    
+    # 距离测量API（/v3/distance）支持的交通方式及其type参数，每次最多100个起点
+    DISTANCE_TYPES = {
+        "driving": 1,
+        "walking": 3
+    }
+    MAX_DISTANCE_ORIGINS = 100
+    
+    # 驾车/步行/骑行路线保留的步骤数与指引长度（与展示一致）
+    MAX_PATH_STEPS = 10
+    MAX_INSTRUCTION_LENGTH = 50
+    
+    # 周边搜索每页条数（AMap上限25）与每圈最多翻页数
+    NEARBY_PAGE_SIZE = 25
+    MAX_NEARBY_PAGES = 4
+    
     def __init__(self):
         self.api_key = settings.amap_api_key
         self.base_url = settings.amap_base_url
+        self.cache = get_cache()
+        self.rate_limiter = get_rate_limiter()
+        self.requester = get_requester()
         
         if not self.api_key:
             raise ValueError("请配置高德地图API Key（在.env文件中设置AMAP_API_KEY）")
     
+    def _request(self, endpoint: str, params: Dict) -> Dict:
+        """
+        调用地图API（按优先级限流，慢请求会自动对冲，端点持续失败时熔断）
+        
+        Args:
+            endpoint: API路径，如"geocode/geo"
+            params: 请求参数（不含key）
+        """
+        url = f"{self.base_url}/{endpoint}"
+        params = {"key": self.api_key, **params}
+        timeout = settings.request_timeout_seconds
+        
+        def fetch() -> Dict:
+            data = requests.get(url, params=params, timeout=timeout).json()
+            # 2xxxx为请求参数错误，不计入上游故障
+            if data.get("status") == "0" and not str(data.get("infocode", "")).startswith("2"):
+                raise UpstreamError(f"{endpoint}: {data.get('info')} ({data.get('infocode')})")
+            return data
+        
+        def call() -> Dict:
+            # 熔断放行后才占用限流令牌；预热等后台任务按低优先级排队。
+            # 对冲请求同样需要令牌，但不等待：取不到令牌就不对冲
+            self.rate_limiter.acquire()
+            return self.requester.call(endpoint, fetch, timeout=timeout,
+                                       admit=self.rate_limiter.try_acquire)
+        
+        return get_breaker(endpoint).call(call)
+    
+    def is_available(self, mode: str) -> bool:
+        """交通方式对应的路线规划端点当前是否可用（未熔断）"""
+        endpoint = self.ROUTE_ENDPOINTS.get(mode, self.ROUTE_ENDPOINTS["transit"])
+        return get_breaker(endpoint).state == CircuitBreaker.CLOSED
+    
     def geocode(self, address: str) -> Optional[Location]:
         """
         地理编码：将地址转换为坐标
         """
-        url = f"{self.base_url}/geocode/geo"
+        cache_key = make_key("geocode", address=address)
+        cached = self.cache.get(cache_key)
+        if cached is not None:
+            return Location(**cached)
+        
         params = {
-            "key": self.api_key,
             "address": address,
             "output": "json"
         }
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
+            data = self._request("geocode/geo", params)
             
             if data.get("status") == "1" and data.get("geocodes"):
                 geocode = data["geocodes"][0]
                 location_str = geocode.get("location", "")
                 if location_str:
                     lon, lat = map(float, location_str.split(","))
-                    return Location(
+                    location = Location(
                         name=address,
                         longitude=lon,
                         latitude=lat,
                         address=geocode.get("formatted_address", address)
                     )
+                    self.cache.set(cache_key, location.model_dump())
+                    return location
         except Exception as e:
             print(f"地理编码错误: {e}")
         
         return None
     
     def search_places(self, keywords: str, city: str = "杭州", 
-                     types: Optional[str] = None) -> List[Location]:
+                     types: Optional[str] = None,
+                     force_refresh: bool = False) -> List[Location]:
         """
         搜索地点（POI搜索）
         
@@ -57,10 +129,14 @@ class MapService:
             keywords: 关键词（如"联想电脑专卖店"）
             city: 城市名称
             types: POI类型（可选）
+            force_refresh: 跳过缓存重新查询，成功后刷新缓存及其有效期
         """
-        url = f"{self.base_url}/place/text"
+        cache_key = make_key("places", keywords=keywords, city=city, types=types)
+        cached = None if force_refresh else self.cache.get(cache_key)
+        if cached is not None:
+            return [Location(**item) for item in cached]
+        
         params = {
-            "key": self.api_key,
             "keywords": keywords,
             "city": city,
             "output": "json",
@@ -74,28 +150,108 @@ class MapService:
         locations = []
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
+            data = self._request("place/text", params)
             
             if data.get("status") == "1" and data.get("pois"):
                 for poi in data["pois"]:
-                    location_str = poi.get("location", "")
-                    if location_str:
-                        lon, lat = map(float, location_str.split(","))
-                        locations.append(Location(
-                            name=poi.get("name", ""),
-                            longitude=lon,
-                            latitude=lat,
-                            address=poi.get("address", "") or poi.get("pname", "") + 
-                                   poi.get("cityname", "") + poi.get("adname", "")
-                        ))
+                    location = self._parse_poi(poi)
+                    if location:
+                        locations.append(location)
         except Exception as e:
             print(f"搜索地点错误: {e}")
         
+        if locations:
+            self.cache.set(cache_key, [loc.model_dump() for loc in locations])
+        
         return locations
     
+    def search_places_nearby(self, keywords: str, center: Location,
+                             city: Optional[str] = None,
+                             min_results: int = 5, max_results: int = 10,
+                             radii: Optional[List[int]] = None,
+                             force_refresh: bool = False) -> List[Location]:
+        """
+        周边搜索（由近到远逐圈扩大半径）
+        
+        从最小半径开始按距离排序搜索，结果不足min_results时才扩大到下一圈，
+        各圈结果按POI ID去重合并，返回按距离排序的前max_results个门店。
+        指定city时只保留该城市的门店（用户在城市边界附近时周边结果可能跨城）。
+        
+        Args:
+            keywords: 关键词（如"联想电脑专卖店"）
+            center: 搜索中心（用户位置）
+            city: 城市名称、citycode或adcode（可选）
+            min_results: 至少需要的门店数
+            max_results: 最多返回的门店数
+            radii: 各圈半径（米），默认使用配置nearby_radii
+            force_refresh: 跳过缓存重新查询，成功后刷新缓存及其有效期
+        """
+        center_str = f"{center.longitude},{center.latitude}"
+        cache_key = make_key("places_nearby", keywords=keywords, center=center_str, city=city,
+                             min_results=min_results, max_results=max_results, radii=radii)
+        cached = None if force_refresh else self.cache.get(cache_key)
+        if cached is not None:
+            return [Location(**item) for item in cached]
+        
+        found: Dict[str, Tuple[float, Location]] = {}  # POI ID -> (距离, 位置)
+        try:
+            for radius in radii or settings.nearby_radii:
+                for page in range(1, self.MAX_NEARBY_PAGES + 1):
+                    params = {
+                        "keywords": keywords,
+                        "location": center_str,
+                        "radius": radius,
+                        "sortrule": "distance",
+                        "output": "json",
+                        "offset": self.NEARBY_PAGE_SIZE,
+                        "page": page
+                    }
+                    if city:
+                        params["city"] = city
+                    data = self._request("place/around", params)
+                    if data.get("status") != "1":
+                        break
+                    pois = data.get("pois") or []
+                    for poi in pois:
+                        if city and not _in_city(poi, city):
+                            continue
+                        location = self._parse_poi(poi)
+                        if location:
+                            key = location.poi_id or f"{location.name}@{poi.get('location')}"
+                            found.setdefault(key, (_to_number(poi.get("distance")), location))
+                    # 本圈已取完，或已足够时不再翻页
+                    if len(pois) < self.NEARBY_PAGE_SIZE or len(found) >= min_results:
+                        break
+                if len(found) >= min_results:
+                    break
+        except Exception as e:
+            print(f"周边搜索错误: {e}")
+        
+        locations = [location for _, location in
+                     sorted(found.values(), key=lambda item: item[0])][:max_results]
+        if locations:
+            self.cache.set(cache_key, [loc.model_dump() for loc in locations])
+        
+        return locations
+    
+    def _parse_poi(self, poi: Dict) -> Optional[Location]:
+        """把POI转换为位置，缺少坐标时返回None"""
+        location_str = _to_text(poi.get("location"))
+        if not location_str:
+            return None
+        lon, lat = map(float, location_str.split(","))
+        return Location(
+            name=_to_text(poi.get("name")),
+            longitude=lon,
+            latitude=lat,
+            address=_to_text(poi.get("address")) or _to_text(poi.get("pname")) +
+                    _to_text(poi.get("cityname")) + _to_text(poi.get("adname")),
+            poi_id=_to_text(poi.get("id")) or None,
+            type_code=_to_text(poi.get("typecode")) or None
+        )
+    
     def get_route(self, origin: Location, destination: Location, 
-                  mode: str = "transit") -> Optional[Dict]:
+                  mode: str = "transit", force_refresh: bool = False) -> Optional[Dict]:
         """
         获取路线规划
         
@@ -107,24 +263,20 @@ class MapService:
                 - walking: 步行
                 - transit: 公交/地铁
                 - riding: 骑行
+            force_refresh: 跳过缓存重新查询，成功后刷新缓存及其有效期
         """
         origin_str = f"{origin.longitude},{origin.latitude}"
         dest_str = f"{destination.longitude},{destination.latitude}"
         
+        cache_key = make_key("route", origin=origin_str, destination=dest_str, mode=mode)
+        cached = None if force_refresh else self.cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
         # 根据交通方式选择不同的API端点
-        if mode == "transit":
-            url = f"{self.base_url}/direction/transit/integrated"
-        elif mode == "driving":
-            url = f"{self.base_url}/direction/driving"
-        elif mode == "walking":
-            url = f"{self.base_url}/direction/walking"
-        elif mode == "riding":
-            url = f"{self.base_url}/direction/bicycling"
-        else:
-            url = f"{self.base_url}/direction/transit/integrated"
+        endpoint = self.ROUTE_ENDPOINTS.get(mode, self.ROUTE_ENDPOINTS["transit"])
         
         params = {
-            "key": self.api_key,
             "origin": origin_str,
             "destination": dest_str,
             "output": "json",
@@ -135,79 +287,205 @@ class MapService:
             params["cityd"] = "杭州"  # 目标城市
         
         try:
-            response = requests.get(url, params=params, timeout=10)
-            data = response.json()
+            data = self._request(endpoint, params)
             
             if data.get("status") == "1":
+                # 只投影出用到的字段，原始响应（含polyline等）不做保留
+                route_data = data.get("route") or {}
                 if mode == "transit":
-                    routes = data.get("route", {}).get("transits", [])
+                    routes = route_data.get("transits") or []
                     if routes:
                         route = routes[0]  # 取第一条路线
-                        return {
-                            "distance": int(route.get("distance", 0)),
-                            "duration": int(route.get("duration", 0)),
-                            "cost": float(route.get("cost", 0)) if route.get("cost") else None,
-                            "steps": route.get("segments", []),
-                            "route_detail": self._format_transit_route(route)
+                        steps = self._parse_transit_steps(route)
+                        result = {
+                            "distance": int(_to_number(route.get("distance"))),
+                            "duration": int(_to_number(route.get("duration"))),
+                            "cost": _to_number(route.get("cost")) or None,
+                            "steps": [step.model_dump(exclude_none=True) for step in steps],
+                            "route_detail": self._format_transit_route(steps)
                         }
+                        self.cache.set(cache_key, result, ttl=settings.route_cache_ttl_seconds)
+                        return result
                 else:
-                    routes = data.get("route", {}).get("paths", [])
+                    routes = route_data.get("paths") or []
                     if routes:
                         route = routes[0]
-                        return {
-                            "distance": int(route.get("distance", 0)),
-                            "duration": int(route.get("duration", 0)),
-                            "steps": route.get("steps", []),
-                            "route_detail": self._format_route(route, mode)
+                        steps = self._parse_path_steps(route)
+                        result = {
+                            "distance": int(_to_number(route.get("distance"))),
+                            "duration": int(_to_number(route.get("duration"))),
+                            "steps": [step.model_dump(exclude_none=True) for step in steps],
+                            "route_detail": self._format_route(steps, mode)
                         }
+                        self.cache.set(cache_key, result, ttl=settings.route_cache_ttl_seconds)
+                        return result
         except Exception as e:
             print(f"路线规划错误: {e}")
         
         return None
     
-    def _format_transit_route(self, route: Dict) -> str:
+    def get_distances(self, origins: List[Location], destination: Location,
+                      mode: str = "driving") -> List[Optional[Dict]]:
+        """
+        距离矩阵：多个起点到同一终点的距离和时间（一次请求最多100个起点）
+        
+        只返回distance、duration，不含路线步骤；已缓存完整路线的起点直接复用。
+        步行单程超过5公里时该起点查询失败，查询失败的起点为None
+        
+        Args:
+            origins: 起点列表
+            destination: 终点
+            mode: driving / walking（公交不支持距离测量）
+        """
+        distance_type = self.DISTANCE_TYPES.get(mode)
+        if distance_type is None:
+            raise ValueError(f"距离测量不支持交通方式: {mode}")
+        
+        dest_str = f"{destination.longitude},{destination.latitude}"
+        origin_strs = [f"{origin.longitude},{origin.latitude}" for origin in origins]
+        results: List[Optional[Dict]] = [None] * len(origins)
+        missing = []
+        for index, origin_str in enumerate(origin_strs):
+            cached = self.cache.get(make_key("route", origin=origin_str, destination=dest_str, mode=mode))
+            if cached is None:
+                cached = self.cache.get(make_key("distance", origin=origin_str,
+                                                 destination=dest_str, mode=mode))
+            if cached is not None:
+                results[index] = {"distance": cached["distance"], "duration": cached["duration"]}
+            else:
+                missing.append(index)
+        
+        for start in range(0, len(missing), self.MAX_DISTANCE_ORIGINS):
+            chunk = missing[start:start + self.MAX_DISTANCE_ORIGINS]
+            params = {
+                "origins": "|".join(origin_strs[index] for index in chunk),
+                "destination": dest_str,
+                "type": str(distance_type),
+                "output": "json"
+            }
+            try:
+                data = self._request("distance", params)
+            except Exception as e:
+                print(f"距离测量错误: {e}")
+                continue
+            if data.get("status") != "1":
+                continue
+            for item in data.get("results") or []:
+                # 单个起点出错时带有code/info字段
+                if item.get("code"):
+                    continue
+                position = int(_to_number(item.get("origin_id"))) - 1
+                if not 0 <= position < len(chunk):
+                    continue
+                index = chunk[position]
+                result = {
+                    "distance": int(_to_number(item.get("distance"))),
+                    "duration": int(_to_number(item.get("duration")))
+                }
+                results[index] = result
+                self.cache.set(make_key("distance", origin=origin_strs[index],
+                                        destination=dest_str, mode=mode),
+                               result, ttl=settings.route_cache_ttl_seconds)
+        return results
+    
+    def _parse_transit_steps(self, route: Dict) -> List[RouteStep]:
+        """
+        单次遍历公交方案的segments，提取步行、公交、地铁步骤
+        
+        AMap在字段缺失时可能返回[]或{}，这里统一按空值处理
+        """
+        steps = []
+        for segment in route.get("segments") or []:
+            walk = segment.get("walking")
+            if walk:
+                steps.append(RouteStep(
+                    type="walking",
+                    distance=_to_number(walk.get("distance")),
+                    duration=int(_to_number(walk.get("duration")))
+                ))
+            buslines = (segment.get("bus") or {}).get("buslines") or []
+            if buslines:
+                busline = buslines[0]
+                steps.append(RouteStep(
+                    type="bus",
+                    name=_to_text(busline.get("name")) or "公交",
+                    departure=_stop_name(busline.get("departure_stop")),
+                    arrival=_stop_name(busline.get("arrival_stop")),
+                    duration=int(_to_number(busline.get("duration")))
+                ))
+            railway = segment.get("railway")
+            if railway and railway.get("name"):
+                steps.append(RouteStep(
+                    type="subway",
+                    name=_to_text(railway.get("name")) or "地铁",
+                    departure=_stop_name(railway.get("departure_stop")),
+                    arrival=_stop_name(railway.get("arrival_stop")),
+                    duration=int(_to_number(railway.get("time") or railway.get("duration")))
+                ))
+        return steps
+    
+    def _parse_path_steps(self, route: Dict) -> List[RouteStep]:
+        """提取驾车/步行/骑行路线的前若干步（指引截断到展示长度）"""
+        return [
+            RouteStep(
+                type="step",
+                instruction=_to_text(step.get("instruction"))[:self.MAX_INSTRUCTION_LENGTH],
+                distance=_to_number(step.get("distance")),
+                duration=int(_to_number(step.get("duration")))
+            )
+            for step in (route.get("steps") or [])[:self.MAX_PATH_STEPS]
+        ]
+    
+    def _format_transit_route(self, steps: List[RouteStep]) -> str:
         """格式化公交路线详情"""
-        segments = route.get("segments", [])
         details = []
         
-        for segment in segments:
-            if segment.get("walking"):
-                walk = segment["walking"]
-                # 确保distance是数字类型（API可能返回字符串）
-                distance = walk.get('distance', 0)
-                try:
-                    distance = float(distance) if distance else 0
-                except (ValueError, TypeError):
-                    distance = 0
-                details.append(f"步行 {distance/1000:.1f}公里")
-            elif segment.get("bus"):
-                bus = segment["bus"]
-                buslines = bus.get("buslines", [])
-                if buslines:
-                    busline = buslines[0]
-                    details.append(
-                        f"乘坐{busline.get('name', '公交')} "
-                        f"({busline.get('departure_stop', {}).get('name', '')} → "
-                        f"{busline.get('arrival_stop', {}).get('name', '')})"
-                    )
-            elif segment.get("railway"):
-                railway = segment["railway"]
-                details.append(
-                    f"乘坐{railway.get('name', '地铁')} "
-                    f"({railway.get('departure_stop', {}).get('name', '')} → "
-                    f"{railway.get('arrival_stop', {}).get('name', '')})"
-                )
+        for step in steps:
+            if step.type == "walking":
+                details.append(f"步行 {step.distance/1000:.1f}公里")
+            else:
+                details.append(f"乘坐{step.name} ({step.departure} → {step.arrival})")
         
         return " → ".join(details) if details else "路线详情"
     
-    def _format_route(self, route: Dict, mode: str) -> str:
+    def _format_route(self, steps: List[RouteStep], mode: str) -> str:
         """格式化路线详情"""
-        steps = route.get("steps", [])
         if not steps:
             return f"{mode}路线"
         
         # 简化显示前几个关键步骤
-        key_steps = steps[:3] if len(steps) > 3 else steps
-        details = [step.get("instruction", "")[:20] for step in key_steps]
+        details = [step.instruction[:20] for step in steps[:3]]
         return " → ".join(details)
 
+
+def _to_number(value) -> float:
+    """AMap数值字段可能是字符串、空列表或缺失，统一转为数字"""
+    try:
+        return float(value) if value else 0
+    except (ValueError, TypeError):
+        return 0
+
+
+def _in_city(poi: Dict, city: str) -> bool:
+    """POI是否属于指定城市（城市名、citycode或adcode），POI缺少城市信息时视为属于"""
+    cityname = _to_text(poi.get("cityname"))
+    adcode = _to_text(poi.get("adcode"))
+    if not cityname and not adcode:
+        return True
+    if city in (_to_text(poi.get("citycode")), adcode):
+        return True
+    if city.isdigit() and len(city) == 6 and adcode:
+        # 城市adcode（如330100）与区县adcode（如330106）比较前4位，直辖市（如110000）比较前2位
+        prefix = city[:2] if city[2:] == "0000" else city[:4]
+        return adcode.startswith(prefix)
+    return bool(cityname) and cityname.rstrip("市") == city.rstrip("市")
+
+
+def _to_text(value) -> str:
+    """AMap文本字段缺失时可能返回空列表"""
+    return value if isinstance(value, str) else ""
+
+
+def _stop_name(stop) -> str:
+    """提取站点名称"""
+    return _to_text(stop.get("name")) if isinstance(stop, dict) else ""
@@ -0,0 +1,161 @@
+"""
+交通方式筛选 - 用离线训练的查找表跳过几乎不可能胜出的交通方式
+
+模型由 python -m src.train_mode_model 根据历史查询结果生成，按
+(城市, 直线距离区间, 时段) 统计各交通方式胜出（时间最短）的概率。
+"""
+import bisect
+import json
+import os
+import random
+import threading
+from typing import Dict, List, Optional
+
+
+# 直线距离区间边界（米）与时段划分（小时）
+DISTANCE_BANDS = [500, 1000, 2000, 3000, 5000, 8000, 12000, 20000, 30000]
+TIME_BANDS = [
+    ("night", 0, 6),
+    ("morning_peak", 7, 9),
+    ("day", 10, 16),
+    ("evening_peak", 17, 19),
+    ("evening", 20, 23)
+]
+
+
+def distance_band(distance: float) -> int:
+    """直线距离所属区间的下标"""
+    return bisect.bisect_right(DISTANCE_BANDS, distance)
+
+
+def time_band(hour: int) -> str:
+    """小时所属时段"""
+    for name, start, end in TIME_BANDS:
+        if start <= hour <= end:
+            return name
+    return "day"
+
+
+def model_keys(city: Optional[str], distance: float, hour: int) -> List[str]:
+    """从细到粗的查找键：城市+距离+时段 → 城市+距离 → 距离"""
+    band = distance_band(distance)
+    keys = []
+    if city:
+        keys.append(f"{city}|{band}|{time_band(hour)}")
+        keys.append(f"{city}|{band}|*")
+    keys.append(f"*|{band}|*")
+    return keys
+
+
+class ModeSelector:
+    """
+    交通方式筛选器
+
+    Args:
+        model_path: 模型文件路径，为空或不存在时不做筛选
+        mode: off（关闭）/ shadow（照常查询全部方式，只统计筛选的准确率）/ on（实际跳过）
+        threshold: 胜出概率低于该值的交通方式被跳过
+        explore_rate: on模式下仍查询全部方式的比例，用于继续记录胜出结果和评估筛选准确率
+    """
+
+    def __init__(self, model_path: Optional[str], mode: str = "shadow", threshold: float = 0.05,
+                 explore_rate: float = 0.05):
+        self.mode = mode
+        self.threshold = threshold
+        self.explore_rate = explore_rate
+        self.table: Dict[str, Dict[str, float]] = {}
+        self.min_samples = 0
+        if mode != "off" and model_path and os.path.exists(model_path):
+            with open(model_path, "r", encoding="utf-8") as f:
+                model = json.load(f)
+            self.table = model.get("table", {})
+            self.min_samples = model.get("min_samples", 0)
+        self._lock = threading.Lock()
+        self.explored = 0
+        self.shadow_counters = {
+            "predictions": 0,
+            "winner_kept": 0,
+            "calls_total": 0,
+            "calls_skippable": 0,
+            "regret_seconds": 0
+        }
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off" and bool(self.table)
+
+    @property
+    def enforcing(self) -> bool:
+        return self.mode == "on" and bool(self.table)
+
+    def explore(self) -> bool:
+        """on模式下按explore_rate抽样，抽中的查询照常查询全部交通方式"""
+        if not self.enforcing or random.random() >= self.explore_rate:
+            return False
+        with self._lock:
+            self.explored += 1
+        return True
+
+    def select(self, modes: List[str], city: Optional[str], distance: float,
+               hour: int, keep: Optional[str] = None) -> List[str]:
+        """
+        返回需要查询的交通方式（保持输入顺序）
+
+        没有足够样本时不做筛选；至少保留胜出概率最高的方式和keep指定的方式。
+        """
+        probabilities = None
+        for key in model_keys(city, distance, hour):
+            entry = self.table.get(key)
+            if entry and entry.get("n", 0) >= self.min_samples:
+                probabilities = entry
+                break
+        if probabilities is None:
+            return list(modes)
+
+        likeliest = max(modes, key=lambda mode: probabilities.get(mode, 0.0))
+        return [
+            mode for mode in modes
+            if mode in (likeliest, keep) or probabilities.get(mode, 0.0) >= self.threshold
+        ]
+
+    def record_shadow(self, selected: List[str], durations: Dict[str, int]):
+        """
+        影子模式：记录筛选结果与实际全部查询结果的差距
+
+        Args:
+            selected: 筛选器会保留的交通方式
+            durations: 实际查询到的各交通方式时间（秒）
+        """
+        if not durations:
+            return
+        winner = min(durations, key=durations.get)
+        kept = [durations[mode] for mode in selected if mode in durations]
+        with self._lock:
+            counters = self.shadow_counters
+            counters["predictions"] += 1
+            counters["calls_total"] += len(durations)
+            counters["calls_skippable"] += len(durations) - len(kept)
+            if winner in selected:
+                counters["winner_kept"] += 1
+            # 被筛掉的胜出方式带来的时间损失（筛选后一条都不剩时按未知处理）
+            if kept:
+                counters["regret_seconds"] += min(kept) - durations[winner]
+
+    def stats(self) -> Dict:
+        with self._lock:
+            counters = dict(self.shadow_counters)
+            explored = self.explored
+        predictions = counters["predictions"]
+        return {
+            "mode": self.mode if self.table else "off",
+            "threshold": self.threshold,
+            "explore_rate": self.explore_rate,
+            "explored": explored,
+            "model_entries": len(self.table),
+            "shadow": {
+                **counters,
+                "accuracy": round(counters["winner_kept"] / predictions, 4) if predictions else None,
+                "call_reduction": round(counters["calls_skippable"] / counters["calls_total"], 4)
+                if counters["calls_total"] else None
+            }
+        }
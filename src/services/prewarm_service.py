@@ -0,0 +1,256 @@
+"""
+缓存预热 - 用查询日志中的热门请求提前填充地图缓存
+
+启动时和之后每隔一段时间，在后台线程中读取查询日志最近的若干行，按出现次数取：
+1. 热门起点：解析位置（地理编码并写入地名词典）
+2. 热门 (门店, 城市)：全城门店搜索
+3. 热门完整查询：搜索并清洗门店后，查询起点到各门店的默认交通方式路线
+门店列表与路线跳过缓存重新查询并写回（force_refresh），从而重置缓存有效期；
+只读缓存的话，命中的条目不会续期，仍会在两轮预热之间过期。同一轮内已刷新过的
+门店列表和路线不再重复查询。
+预热走与线上查询相同的调用路径（限流、对冲、熔断），以后台优先级限流；
+未配置上游限流时优先级不起作用，预热与线上请求平等竞争上游配额。
+位置解析与候选清洗的命中统计不计入预热流量。
+多worker共享SQLite缓存时，只有持有预热文件锁的worker执行预热，其余worker待命，
+持锁的worker退出后由下一轮检查的worker接替。
+"""
+import copy
+import json
+import os
+import threading
+import time
+from collections import Counter, deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from src.config import settings
+from src.services.location_resolver import LocationResolver
+from src.services.map_service import MapService
+from src.services.route_service import RouteService
+from src.utils.rate_limiter import background_priority
+
+try:
+    import fcntl
+except ImportError:  # Windows下没有fcntl，不限制预热的worker数
+    fcntl = None
+
+
+def read_recent_queries(path: str, max_lines: int) -> List[Dict[str, Any]]:
+    """读取查询日志最后max_lines行中的有效记录"""
+    if not path or not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        lines = deque(f, maxlen=max_lines)
+    records = []
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        if record.get("user_location") and record.get("store_name"):
+            records.append(record)
+    return records
+
+
+class Prewarmer:
+    """
+    缓存预热器
+
+    Args:
+        location_resolver: 位置解析器
+        map_service: 地图服务
+        route_service: 路线服务
+        search_stores: 门店搜索函数，即 MCPClient.search_stores
+        log_path: 查询日志路径
+        interval: 两次预热之间的间隔（秒）
+        log_lines: 只读取日志最后的行数
+        top_origins / top_chains / top_queries: 各阶段预热的条目数
+        lock_path: 预热文件锁路径，多worker共享缓存时只有持锁的worker预热；为空则不加锁
+    """
+
+    STAGES = ("origins", "chains", "queries")
+
+    def __init__(self, location_resolver: LocationResolver, map_service: MapService,
+                 route_service: RouteService, search_stores: Callable[..., Tuple[list, dict]],
+                 log_path: Optional[str], interval: float = 1500.0, log_lines: int = 20000,
+                 top_origins: int = 50, top_chains: int = 20, top_queries: int = 20,
+                 lock_path: Optional[str] = None):
+        self.location_resolver = location_resolver
+        self.map_service = map_service
+        self.route_service = route_service
+        self.search_stores = search_stores
+        self.log_path = log_path
+        self.interval = interval
+        self.log_lines = log_lines
+        self.top_origins = top_origins
+        self.top_chains = top_chains
+        self.top_queries = top_queries
+        self.lock_path = lock_path
+        self._lock_file = None
+        self._refreshed: set = set()  # 本轮已刷新的门店列表与路线
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.state = {
+            "status": "idle",
+            "runs": 0,
+            "stage": None,
+            "progress": {stage: {"done": 0, "total": 0} for stage in self.STAGES},
+            "errors": 0,
+            "duplicates_skipped": 0,
+            "last_started": None,
+            "last_finished": None,
+            "last_duration_seconds": None
+        }
+
+    def start(self):
+        """启动后台预热线程（立即预热一次，之后按间隔重复）"""
+        if not self.log_path or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="cache-prewarm", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._lock_file is not None:
+            # 关闭文件即释放锁，其他worker下一轮可以接替
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _acquire_leader(self) -> bool:
+        """尝试（不等待）取得预热文件锁，取得后一直持有到进程退出或stop()"""
+        if not self.lock_path or fcntl is None or self._lock_file is not None:
+            return True
+        directory = os.path.dirname(self.lock_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def _loop(self):
+        while not self._stop.is_set():
+            if not self._acquire_leader():
+                # 其他worker正在预热共享缓存
+                self._set(status="standby", stage=None)
+                self._stop.wait(self.interval)
+                continue
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"缓存预热错误: {e}")
+            self._set(status="waiting", stage=None)
+            self._stop.wait(self.interval)
+
+    def run_once(self):
+        """执行一轮预热"""
+        records = read_recent_queries(self.log_path, self.log_lines)
+        origins, chains, queries = self._popular(records)
+        self._refreshed = set()
+        started = time.time()
+        with self._lock:
+            self.state.update(status="running", last_started=started)
+            self.state["runs"] += 1
+            self.state["duplicates_skipped"] = 0
+            self.state["progress"] = {
+                "origins": {"done": 0, "total": len(origins)},
+                "chains": {"done": 0, "total": len(chains)},
+                "queries": {"done": 0, "total": len(queries)}
+            }
+
+        with background_priority():
+            self._run_stage("origins", origins,
+                            lambda origin: self.location_resolver.resolve(origin, record_stats=False))
+            self._run_stage("chains", chains, lambda item: self._warm_chain(*item))
+            self._run_stage("queries", queries, lambda item: self._warm_query(*item))
+
+        finished = time.time()
+        self._set(last_finished=finished, last_duration_seconds=round(finished - started, 2))
+
+    def _popular(self, records: List[Dict[str, Any]]) -> Tuple[List, List, List]:
+        """按出现次数取热门起点、(门店, 城市) 和完整查询"""
+        origins = Counter()
+        chains = Counter()
+        queries = Counter()
+        for record in records:
+            origin = record["user_location"].strip()
+            chain = (record["store_name"].strip(), record.get("city") or "杭州")
+            origins[origin] += 1
+            chains[chain] += 1
+            queries[(origin, *chain, record.get("search_mode"))] += 1
+        return ([item for item, _ in origins.most_common(self.top_origins)],
+                [item for item, _ in chains.most_common(self.top_chains)],
+                [item for item, _ in queries.most_common(self.top_queries)])
+
+    def _warm_chain(self, store_name: str, city: str):
+        """刷新全城门店列表"""
+        self.map_service.search_places(keywords=store_name, city=city, force_refresh=True)
+        self._refreshed.add(("places", store_name, city))
+
+    def _warm_query(self, origin_str: str, store_name: str, city: str, search_mode: Optional[str]):
+        """刷新一次完整查询用到的门店列表和路线（本轮已刷新过的跳过）"""
+        origin = self.location_resolver.resolve(origin_str, record_stats=False)
+        if origin is None:
+            return
+        modes = self.route_service.DEFAULT_TRAFFIC_MODES
+        # 全城搜索的门店列表可能已在chains阶段刷新过，此时直接读缓存
+        by_city = (search_mode or settings.store_search_mode) != "nearby"
+        places_key = ("places", store_name, city)
+        refresh_stores = not (by_city and places_key in self._refreshed)
+        if not refresh_stores:
+            self._skipped()
+        stores, _ = self.search_stores(store_name, city, origin, search_mode,
+                                       calls_per_store=len(modes),
+                                       force_refresh=refresh_stores, record_stats=False)
+        if by_city:
+            self._refreshed.add(places_key)
+        for store in stores:
+            for mode in modes:
+                if self._stop.is_set():
+                    return
+                route_key = ("route", origin.longitude, origin.latitude,
+                             store.longitude, store.latitude, mode)
+                if route_key in self._refreshed:
+                    self._skipped()
+                    continue
+                self.route_service.get_route(origin, store, mode, force_refresh=True)
+                self._refreshed.add(route_key)
+
+    def _skipped(self):
+        with self._lock:
+            self.state["duplicates_skipped"] += 1
+
+    def _run_stage(self, stage: str, items: List, warm: Callable[[Any], Any]):
+        self._set(stage=stage)
+        for item in items:
+            if self._stop.is_set():
+                return
+            try:
+                warm(item)
+            except Exception as e:
+                print(f"缓存预热错误（{stage}）: {e}")
+                with self._lock:
+                    self.state["errors"] += 1
+            with self._lock:
+                self.state["progress"][stage]["done"] += 1
+
+    def _set(self, **values):
+        with self._lock:
+            self.state.update(values)
+
+    def stats(self) -> Dict:
+        """预热进度"""
+        with self._lock:
+            state = copy.deepcopy(self.state)
+        done = sum(item["done"] for item in state["progress"].values())
+        total = sum(item["total"] for item in state["progress"].values())
+        return {
+            "enabled": bool(self.log_path),
+            "lock_held": self._lock_file is not None if self.lock_path and fcntl else None,
+            **state,
+            "completion": round(done / total, 4) if total else None
+        }
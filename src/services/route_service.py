@@ -1,20 +1,59 @@
 """
 路线查询服务
 """
-from typing import List, Dict
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional
+from src.config import settings
 from src.models.destination import Location, RouteInfo
 from src.services.map_service import MapService
+from src.services.mode_selector import ModeSelector
+from src.utils.helpers import haversine_distance
 
 
 class RouteService:
     """路线查询服务类"""
     
+    # 降级预估模型：(绕行系数, 平均速度 米/秒, 固定附加时间 秒)
+    ESTIMATE_MODELS = {
+        "transit": (1.4, 5.5, 600),   # 含步行接驳与候车
+        "driving": (1.3, 8.3, 180),   # 含起步与停车
+        "walking": (1.25, 1.2, 0),
+        "riding": (1.25, 4.0, 60)
+    }
+    
+    # 乐观速度（米/秒），用于计算行程时间下界：假定实际路线不会比按此速度走直线更快
+    # （取值需高于该方式在城市中的实际直线等效速度，否则下界不成立）
+    OPTIMISTIC_SPEEDS = {
+        "transit": 12.0,
+        "driving": 22.0,
+        "walking": 1.8,
+        "riding": 6.0
+    }
+    
+    # 批量查询路线时的并发数
+    MAX_WORKERS = 8
+    
+    # 未指定时比较的交通方式
+    DEFAULT_TRAFFIC_MODES = ["transit", "driving", "walking"]
+    
     def __init__(self):
         self.map_service = MapService()
+        self.mode_selector = ModeSelector(
+            settings.mode_model_path,
+            mode=settings.mode_model_mode,
+            threshold=settings.mode_model_threshold,
+            explore_rate=settings.mode_model_explore_rate
+        )
+        self._outcome_lock = threading.Lock()
     
     def get_all_routes(self, user_location: Location, 
                       store_locations: List[Location],
-                      traffic_modes: List[str] = None) -> List[RouteInfo]:
+                      traffic_modes: List[str] = None,
+                      city: Optional[str] = None,
+                      preferred_mode: Optional[str] = None) -> List[RouteInfo]:
         """
         批量查询所有路线
         
@@ -22,34 +61,188 @@ class RouteService:
             user_location: 用户位置
             store_locations: 门店位置列表
             traffic_modes: 交通方式列表，默认["transit", "driving", "walking"]
+            city: 城市（交通方式筛选模型按城市区分）
+            preferred_mode: 偏好的交通方式，筛选时始终保留
         """
         if traffic_modes is None:
-            traffic_modes = ["transit", "driving", "walking"]
+            traffic_modes = self.DEFAULT_TRAFFIC_MODES
         
         all_routes = []
+        hour = time.localtime().tm_hour
         
         for store in store_locations:
-            for mode in traffic_modes:
-                route_data = self.map_service.get_route(
-                    origin=user_location,
-                    destination=store,
-                    mode=mode
+            modes = traffic_modes
+            selected = None
+            if self.mode_selector.enabled and len(traffic_modes) > 1:
+                selected = self.mode_selector.select(
+                    traffic_modes, city,
+                    self.straight_distance(user_location, store), hour,
+                    keep=preferred_mode
                 )
-                
-                if route_data:
-                    route_info = RouteInfo(
-                        destination=store,
-                        distance=route_data.get("distance", 0),
-                        duration=route_data.get("duration", 0),
-                        traffic_mode=mode,
-                        route_detail=route_data.get("route_detail"),
-                        cost=route_data.get("cost"),
-                        steps=route_data.get("steps")
-                    )
-                    all_routes.append(route_info)
+                # on模式下抽样的一部分查询仍查询全部方式，保证结果日志和影子评估不中断
+                if self.mode_selector.enforcing and not self.mode_selector.explore():
+                    modes = selected
+            
+            store_routes = []
+            for mode in modes:
+                route_info = self.get_route(user_location, store, mode)
+                if route_info:
+                    store_routes.append(route_info)
+            all_routes.extend(store_routes)
+            
+            # 查询了全部交通方式时，记录胜出结果供筛选模型训练与影子评估
+            if set(modes) == set(traffic_modes) and store_routes and \
+                    not any(route.estimated for route in store_routes):
+                durations = {route.traffic_mode: route.duration for route in store_routes}
+                if selected is not None:
+                    self.mode_selector.record_shadow(selected, durations)
+                self._log_outcome(user_location, store, city, hour, durations)
         
         return all_routes
     
+    def _log_outcome(self, origin: Location, destination: Location,
+                     city: Optional[str], hour: int, durations: Dict[str, int]):
+        """追加一条交通方式胜出记录（JSONL）"""
+        if not settings.outcome_log_path or len(durations) < 2:
+            return
+        record = {
+            "ts": time.time(),
+            "city": city,
+            "hour": hour,
+            "distance": round(self.straight_distance(origin, destination)),
+            "winner": min(durations, key=durations.get),
+            "durations": durations
+        }
+        try:
+            with self._outcome_lock, open(settings.outcome_log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"结果日志写入错误: {e}")
+    
+    def get_route(self, origin: Location, destination: Location,
+                  mode: str, force_refresh: bool = False) -> Optional[RouteInfo]:
+        """查询单条路线，上游熔断时返回预估路线（force_refresh时跳过缓存重新查询）"""
+        route_data = self.map_service.get_route(
+            origin=origin,
+            destination=destination,
+            mode=mode,
+            force_refresh=force_refresh
+        )
+        
+        if route_data:
+            return RouteInfo(
+                destination=destination,
+                distance=route_data.get("distance", 0),
+                duration=route_data.get("duration", 0),
+                traffic_mode=mode,
+                route_detail=route_data.get("route_detail"),
+                cost=route_data.get("cost"),
+                steps=route_data.get("steps")
+            )
+        if not self.map_service.is_available(mode):
+            # 上游已熔断：用直线距离快速预估，避免等待超时
+            return self.estimate_route(origin, destination, mode)
+        return None
+    
+    def get_route_matrix(self, origins: List[Location], destinations: List[Location],
+                         mode: str) -> List[List[Optional[RouteInfo]]]:
+        """
+        查询 目的地 × 起点 的路线矩阵
+        
+        驾车、步行用距离测量API，每个目的地一次请求（只有距离和时间，不含路线步骤，
+        需要时用add_route_details补充）；距离测量失败的起点再逐条查询路线。
+        公交没有批量接口，按 起点数 × 目的地数 逐条并发查询，上游调用量随两者线性增长。
+        
+        Returns:
+            matrix[i][j] 为 origins[j] 到 destinations[i] 的路线，查询失败为None
+        """
+        if not destinations:
+            return []
+        if not origins:
+            return [[] for _ in destinations]
+        if mode in self.map_service.DISTANCE_TYPES:
+            matrix = self._distance_matrix(origins, destinations, mode)
+        else:
+            matrix = [[None] * len(origins) for _ in destinations]
+        
+        pairs = [(i, j) for i in range(len(destinations)) for j in range(len(origins))
+                 if matrix[i][j] is None]
+        if pairs:
+            with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(pairs))) as executor:
+                routes = list(executor.map(
+                    lambda pair: self.get_route(origins[pair[1]], destinations[pair[0]], mode), pairs
+                ))
+            for (i, j), route in zip(pairs, routes):
+                matrix[i][j] = route
+        return matrix
+    
+    def _distance_matrix(self, origins: List[Location], destinations: List[Location],
+                         mode: str) -> List[List[Optional[RouteInfo]]]:
+        """用距离测量API并发查询每个目的地的一列（只有距离和时间）"""
+        with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(destinations))) as executor:
+            columns = list(executor.map(
+                lambda destination: self.map_service.get_distances(origins, destination, mode),
+                destinations
+            ))
+        return [
+            [
+                RouteInfo(
+                    destination=destination,
+                    distance=item["distance"],
+                    duration=item["duration"],
+                    traffic_mode=mode
+                ) if item else None
+                for item in column
+            ]
+            for destination, column in zip(destinations, columns)
+        ]
+    
+    def add_route_details(self, origins: List[Location],
+                          routes: List[RouteInfo]) -> List[RouteInfo]:
+        """
+        为距离矩阵得到的路线补充路线详情与步骤（距离和时间保持不变，与排名一致）
+        
+        Args:
+            origins: 各路线的起点
+            routes: origins对应的路线
+        """
+        def detail(origin: Location, route: RouteInfo) -> RouteInfo:
+            if route.route_detail or route.estimated:
+                return route
+            full = self.get_route(origin, route.destination, route.traffic_mode)
+            if full is None or full.estimated:
+                return route
+            return route.model_copy(update={
+                "route_detail": full.route_detail,
+                "cost": full.cost,
+                "steps": full.steps
+            })
+        
+        with ThreadPoolExecutor(max_workers=max(1, min(self.MAX_WORKERS, len(routes)))) as executor:
+            return list(executor.map(detail, origins, routes))
+    
+    def straight_distance(self, origin: Location, destination: Location) -> float:
+        """两点间直线距离（米），无需调用上游"""
+        return haversine_distance(origin.longitude, origin.latitude,
+                                  destination.longitude, destination.latitude)
+    
+    def estimate_route(self, origin: Location, destination: Location,
+                       mode: str) -> RouteInfo:
+        """
+        根据直线距离和交通方式速度模型预估路线（地图服务降级时使用）
+        """
+        detour, speed, overhead = self.ESTIMATE_MODELS.get(mode, self.ESTIMATE_MODELS["transit"])
+        distance = haversine_distance(origin.longitude, origin.latitude,
+                                      destination.longitude, destination.latitude) * detour
+        return RouteInfo(
+            destination=destination,
+            distance=round(distance),
+            duration=int(distance / speed + overhead),
+            traffic_mode=mode,
+            route_detail="预估路线（地图服务暂不可用，按直线距离估算）",
+            estimated=True
+        )
+    
     def compare_routes(self, routes: List[RouteInfo]) -> Dict:
         """
         比较路线，返回排序后的结果
@@ -0,0 +1,178 @@
+"""
+会话服务 - 用户移动时增量更新门店排名
+
+会话内保留门店列表和每个门店各交通方式的路线。位置更新时，记新旧起点之间
+步行所需时间为 w = Δ × 步行绕行系数 / 步行速度（Δ为移动的直线距离），
+每条已知路线（时间d）在新起点下的时间满足：
+- 上界：d + w（从新起点走回旧起点，再走旧路线）
+- 下界：d - w（从旧起点走到新起点再走新路线也是一条可行路线，它不会比d更快）
+两者都以步行连接新旧起点，与路线本身的交通方式无关：公交、驾车在短距离内
+可能慢于步行（候车、绕行），不能用该方式的速度估计连接段。
+只有上下界区间与其他候选门店重叠、排名可能变化的门店才重新查询路线。
+"""
+from typing import Dict, List, Optional, Tuple
+from src.models.destination import Location, RouteInfo
+from src.services.route_service import RouteService
+
+
+class _StoreState:
+    """单个门店在会话中的路线状态"""
+
+    def __init__(self, store: Location):
+        self.store = store
+        # 交通方式 -> (路线, 查询该路线时的起点)
+        self.routes: Dict[str, Tuple[RouteInfo, Location]] = {}
+        self.exact = False  # 当前位置下是否为精确查询结果
+
+    def bounds(self, route_service: RouteService, origin: Location) -> Dict[str, Tuple[float, float]]:
+        """各交通方式在新起点下的时间上下界（新旧起点之间按步行计）"""
+        detour, speed, _ = route_service.ESTIMATE_MODELS["walking"]
+        result = {}
+        for mode, (route, anchor) in self.routes.items():
+            walk = route_service.straight_distance(anchor, origin) * detour / speed
+            result[mode] = (max(0.0, route.duration - walk), route.duration + walk)
+        return result
+
+    def best(self) -> Optional[RouteInfo]:
+        """当前已知的最快路线"""
+        routes = [route for route, _ in self.routes.values()]
+        return min(routes, key=lambda route: route.duration) if routes else None
+
+
+class RankingSession:
+    """
+    单个客户端会话
+
+    Args:
+        route_service: 路线服务
+        store_locations: 门店列表（会话期间不变）
+        traffic_modes: 参与比较的交通方式
+        top_k: 推送给客户端的排名长度
+        min_move: 小于该距离（米）的移动视为原地不动
+    """
+
+    def __init__(self, route_service: RouteService, store_locations: List[Location],
+                 traffic_modes: List[str], top_k: int = 5, min_move: float = 30.0):
+        self.route_service = route_service
+        self.stores = [_StoreState(store) for store in store_locations]
+        self.traffic_modes = traffic_modes
+        self.top_k = top_k
+        self.min_move = min_move
+        self.origin: Optional[Location] = None
+        self.ranking: List[dict] = []
+        self.route_calls = 0
+        self.route_calls_saved = 0
+
+    def start(self, origin: Location) -> Dict:
+        """首次定位：查询全部门店的全部交通方式"""
+        self.origin = origin
+        for state in self.stores:
+            self._reroute(state, self.traffic_modes)
+        self.ranking = self._rank()
+        return {"type": "ranking", "ranking": self.ranking, "rerouted": len(self.stores)}
+
+    def update(self, origin: Location) -> Dict:
+        """位置更新：只重新查询排名可能变化的门店，返回排名差异"""
+        if self.origin is None:
+            return self.start(origin)
+        if self.route_service.straight_distance(self.origin, origin) < self.min_move:
+            self.route_calls_saved += len(self.stores) * len(self.traffic_modes)
+            return self._diff([], rerouted=0)
+        self.origin = origin
+
+        # 各门店在新位置下的时间区间（取各交通方式的最小值）
+        intervals = []
+        for state in self.stores:
+            bounds = state.bounds(self.route_service, origin)
+            state.exact = False
+            if bounds:
+                intervals.append((min(lo for lo, _ in bounds.values()),
+                                  min(hi for _, hi in bounds.values()),
+                                  state, bounds))
+
+        # 上界第top_k小的值以内的门店才可能进入前top_k名
+        upper_bounds = sorted(hi for _, hi, _, _ in intervals)
+        cutoff = upper_bounds[min(self.top_k, len(upper_bounds)) - 1] if upper_bounds else 0
+        candidates = [item for item in intervals if item[0] <= cutoff]
+
+        rerouted = 0
+        calls_before = self.route_calls
+        for lo, hi, state, bounds in candidates:
+            overlaps = any(other is not state and other_lo < hi and lo < other_hi
+                           for other_lo, other_hi, other, _ in candidates)
+            if not overlaps:
+                continue
+            # 下界不优于该门店当前上界的交通方式不可能成为最优，不必重查
+            modes = [mode for mode, (mode_lo, _) in bounds.items() if mode_lo < hi]
+            self._reroute(state, modes)
+            rerouted += 1
+
+        # 与整体重新查询（全部门店 × 全部交通方式）相比省下的路线查询
+        full_requery = len(self.stores) * len(self.traffic_modes)
+        self.route_calls_saved += full_requery - (self.route_calls - calls_before)
+
+        old_ranking = self.ranking
+        self.ranking = self._rank()
+        changes = self._changes(old_ranking, self.ranking)
+        return self._diff(changes, rerouted=rerouted)
+
+    def _reroute(self, state: _StoreState, modes: List[str]):
+        for mode in modes:
+            self.route_calls += 1
+            route = self.route_service.get_route(self.origin, state.store, mode)
+            if route:
+                state.routes[mode] = (route, self.origin)
+            else:
+                state.routes.pop(mode, None)
+        state.exact = True
+
+    def _rank(self) -> List[dict]:
+        """按当前已知的最快路线排序，取前top_k名"""
+        entries = []
+        for state in self.stores:
+            best = state.best()
+            if best is None:
+                continue
+            entries.append({
+                "destination": state.store.name,
+                "address": state.store.address,
+                "coordinates": {
+                    "longitude": state.store.longitude,
+                    "latitude": state.store.latitude
+                },
+                "traffic_mode": best.traffic_mode,
+                "duration_seconds": best.duration,
+                "distance_meters": best.distance,
+                # 未重新查询的门店沿用旧路线，时间为近似值
+                "exact": state.exact and not best.estimated
+            })
+        entries.sort(key=lambda entry: entry["duration_seconds"])
+        for rank, entry in enumerate(entries[:self.top_k], 1):
+            entry["rank"] = rank
+        return entries[:self.top_k]
+
+    def _changes(self, old: List[dict], new: List[dict]) -> List[dict]:
+        """计算排名差异（新进入、名次变化、路线变化、掉出前top_k）"""
+        old_by_name = {entry["destination"]: entry for entry in old}
+        new_names = {entry["destination"] for entry in new}
+        changes = []
+        for entry in new:
+            previous = old_by_name.get(entry["destination"])
+            if (previous is None or previous["rank"] != entry["rank"]
+                    or previous["duration_seconds"] != entry["duration_seconds"]
+                    or previous["traffic_mode"] != entry["traffic_mode"]):
+                changes.append({**entry, "old_rank": previous["rank"] if previous else None})
+        for entry in old:
+            if entry["destination"] not in new_names:
+                changes.append({"destination": entry["destination"],
+                                "old_rank": entry["rank"], "rank": None})
+        return changes
+
+    def _diff(self, changes: List[dict], rerouted: int) -> Dict:
+        return {
+            "type": "diff",
+            "changes": changes,
+            "rerouted": rerouted,
+            "route_calls": self.route_calls,
+            "route_calls_saved": self.route_calls_saved
+        }
@@ -0,0 +1,96 @@
+"""
+交通方式筛选模型训练
+
+用法:
+    python -m src.train_mode_model <结果日志.jsonl> --output data/mode_model.json
+                                   [--min-samples 20] [--threshold 0.05]
+
+结果日志由 OUTCOME_LOG_PATH 配置开启记录，每行包含 city、hour、distance（直线距离，米）
+和 winner（时间最短的交通方式）。输出的查找表供 RouteService 加载。
+"""
+import argparse
+import json
+import os
+from collections import defaultdict
+from typing import Any, Dict, Iterator, List
+from src.services.mode_selector import DISTANCE_BANDS, ModeSelector, model_keys
+
+
+def read_outcomes(path: str) -> Iterator[Dict[str, Any]]:
+    """逐行读取结果日志，跳过不完整的记录"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("winner") and record.get("distance") is not None:
+                yield record
+
+
+def train(records: List[Dict[str, Any]], min_samples: int) -> Dict[str, Any]:
+    """统计每个查找键下各交通方式的胜出概率"""
+    counts: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+    for record in records:
+        for key in model_keys(record.get("city"), record["distance"], int(record.get("hour", 12))):
+            counts[key][record["winner"]] += 1
+
+    table = {}
+    for key, winners in counts.items():
+        total = sum(winners.values())
+        entry = {mode: round(count / total, 4) for mode, count in winners.items()}
+        entry["n"] = total
+        table[key] = entry
+    return {
+        "version": 1,
+        "distance_bands": DISTANCE_BANDS,
+        "min_samples": min_samples,
+        "table": table
+    }
+
+
+def evaluate(model_path: str, records: List[Dict[str, Any]], threshold: float) -> Dict[str, Any]:
+    """在给定记录上评估筛选效果：胜出方式保留率与可省掉的路线查询比例"""
+    selector = ModeSelector(model_path, mode="shadow", threshold=threshold)
+    for record in records:
+        durations = record.get("durations") or {record["winner"]: 0}
+        selected = selector.select(list(durations), record.get("city"),
+                                   record["distance"], int(record.get("hour", 12)))
+        selector.record_shadow(selected, durations)
+    return selector.stats()["shadow"]
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description="训练交通方式筛选模型")
+    parser.add_argument("log", help="交通方式胜出记录（JSONL）")
+    parser.add_argument("--output", default="data/mode_model.json", help="模型输出路径")
+    parser.add_argument("--min-samples", type=int, default=20, help="查找键至少需要的样本数")
+    parser.add_argument("--threshold", type=float, default=0.05, help="评估时使用的跳过阈值")
+    parser.add_argument("--holdout", type=float, default=0.2, help="留作评估的记录比例（按时间顺序取最后一段）")
+    args = parser.parse_args()
+
+    records = list(read_outcomes(args.log))
+    if not records:
+        print("没有可用的训练记录")
+        return
+    split = int(len(records) * (1 - args.holdout)) if len(records) > 1 else len(records)
+    train_records, test_records = records[:split], records[split:] or records
+
+    model = train(train_records, args.min_samples)
+    directory = os.path.dirname(os.path.abspath(args.output))
+    os.makedirs(directory, exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(model, f, ensure_ascii=False, indent=2)
+
+    report = evaluate(args.output, test_records, args.threshold)
+    print(json.dumps({
+        "train_records": len(train_records),
+        "test_records": len(test_records),
+        "model_entries": len(model["table"]),
+        "evaluation": report
+    }, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+缓存后端：进程内内存缓存与跨进程共享缓存
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+from src.config import settings
+
+
+def make_key(namespace: str, **params) -> str:
+    """根据命名空间和参数生成缓存键"""
+    return f"{namespace}:" + json.dumps(params, ensure_ascii=False, sort_keys=True)
+
+
+class MemoryCache:
+    """进程内LRU缓存（每个worker各自持有一份）"""
+
+    backend = "memory"
+
+    def __init__(self, max_entries: int = 10000, ttl: int = 86400):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，不存在或已过期返回None"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None or item[0] < time.time():
+                if item is not None:
+                    del self._data[key]
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        expires_at = time.time() + (ttl or self.ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def size(self) -> int:
+        with self._lock:
+            return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "backend": self.backend,
+            "entries": self.size(),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0
+        }
+
+
+class SQLiteCache(MemoryCache):
+    """
+    基于本地SQLite文件的跨进程共享缓存
+
+    多个uvicorn worker打开同一个文件，任一进程写入的结果对其他进程立即可见。
+    写入在单个事务内完成（原子），条目数超过上限时按写入时间淘汰最旧的条目。
+    """
+
+    backend = "sqlite"
+
+    # 每写入多少次检查一次容量上限
+    EVICT_INTERVAL = 100
+
+    def __init__(self, path: str, max_entries: int = 10000, ttl: int = 86400):
+        super().__init__(max_entries=max_entries, ttl=ttl)
+        self.path = path
+        self._local = threading.local()
+        self._writes = 0
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, expires_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_cache_created ON cache(created_at)")
+
+    def _connect(self) -> sqlite3.Connection:
+        """每个线程使用独立连接（sqlite3连接不能跨线程共享）"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            row = self._connect().execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error as e:
+            print(f"缓存读取错误: {e}")
+            row = None
+        with self._lock:
+            if row is None or row[1] < time.time():
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(row[0])
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None):
+        now = time.time()
+        payload = json.dumps(value, ensure_ascii=False)
+        try:
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, created_at, expires_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    (key, payload, now, now + (ttl or self.ttl))
+                )
+                with self._lock:
+                    self._writes += 1
+                    evict = self._writes % self.EVICT_INTERVAL == 0
+                if evict:
+                    self._evict(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        except sqlite3.Error as e:
+            print(f"缓存写入错误: {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """删除过期条目，并把条目数压回上限以内"""
+        conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+        count = conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM cache WHERE key IN "
+                "(SELECT key FROM cache ORDER BY created_at ASC LIMIT ?)",
+                (excess,)
+            )
+
+    def size(self) -> int:
+        try:
+            return self._connect().execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def stats(self) -> Dict[str, Any]:
+        result = super().stats()
+        result["path"] = self.path
+        result["pid"] = os.getpid()
+        return result
+
+
+def create_cache(backend: str, path: str, max_entries: int, ttl: int) -> MemoryCache:
+    """根据配置创建缓存后端"""
+    if backend == "sqlite":
+        return SQLiteCache(path=path, max_entries=max_entries, ttl=ttl)
+    if backend == "memory":
+        return MemoryCache(max_entries=max_entries, ttl=ttl)
+    raise ValueError(f"不支持的缓存后端: {backend}")
+
+
+_cache: Optional[MemoryCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_cache() -> MemoryCache:
+    """获取全局缓存实例（同一进程内的所有MapService共用）"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = create_cache(
+                    backend=settings.cache_backend,
+                    path=settings.cache_path,
+                    max_entries=settings.cache_max_entries,
+                    ttl=settings.cache_ttl_seconds
+                )
+    return _cache
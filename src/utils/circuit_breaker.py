@@ -0,0 +1,127 @@
+"""
+熔断器：上游连续失败时快速失败，并在后台半开探测，恢复后自动闭合
+"""
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+from src.config import settings
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求未发往上游"""
+
+
+class CircuitBreaker:
+    """
+    单个上游端点的熔断器
+
+    - closed：正常放行，连续失败达到阈值后打开
+    - open：直接拒绝请求；冷却时间后由后台线程重放最近一次失败的请求进行探测
+    - half_open：探测进行中，仍拒绝业务请求；探测成功则闭合，失败则继续打开
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, cooldown: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.rejected = 0
+        self._last_call: Optional[Callable[[], Any]] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        """是否放行业务请求"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            self.rejected += 1
+            return False
+
+    def call(self, func: Callable[[], Any]) -> Any:
+        """经过熔断器执行上游调用"""
+        if not self.allow():
+            raise CircuitOpenError(f"{self.name} 已熔断")
+        try:
+            result = func()
+        except Exception:
+            self.record_failure(func)
+            raise
+        self.record_success()
+        return result
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+
+    def record_failure(self, func: Optional[Callable[[], Any]] = None):
+        with self._lock:
+            self.failures += 1
+            if func is not None:
+                self._last_call = func
+            if self.state != self.CLOSED or self.failures < self.failure_threshold:
+                return
+            self.state = self.OPEN
+            self.opened_at = time.time()
+        print(f"熔断器打开: {self.name}")
+        threading.Thread(target=self._probe_loop, daemon=True,
+                         name=f"breaker-probe-{self.name}").start()
+
+    def _probe_loop(self):
+        """后台半开探测，直到上游恢复"""
+        while True:
+            time.sleep(self.cooldown)
+            with self._lock:
+                self.state = self.HALF_OPEN
+                probe = self._last_call
+            try:
+                if probe is not None:
+                    probe()
+            except Exception:
+                with self._lock:
+                    self.state = self.OPEN
+                    self.opened_at = time.time()
+                continue
+            with self._lock:
+                self.state = self.CLOSED
+                self.failures = 0
+                self.opened_at = None
+            print(f"熔断器恢复: {self.name}")
+            return
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "state": self.state,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "opened_at": self.opened_at
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name: str) -> CircuitBreaker:
+    """获取（或创建）端点对应的熔断器，同一进程内共用"""
+    with _breakers_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker(
+                name,
+                failure_threshold=settings.breaker_failure_threshold,
+                cooldown=settings.breaker_cooldown_seconds
+            )
+        return _breakers[name]
+
+
+def breaker_stats() -> Dict[str, Dict[str, Any]]:
+    """所有熔断器的状态"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.stats() for breaker in breakers}
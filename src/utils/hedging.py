@@ -0,0 +1,221 @@
+"""
+对冲请求：上游调用超过自适应阈值仍未返回时，补发一个重复请求，取先返回者
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from typing import Any, Callable, Dict, Optional
+from src.config import settings
+
+
+class LatencyTracker:
+    """记录单个端点最近的响应耗时，用于计算分位数"""
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q: float) -> Optional[float]:
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._samples)
+
+
+class HedgeBudget:
+    """
+    对冲预算（令牌桶）
+
+    每个主请求存入 ratio 个令牌，每次对冲消耗1个令牌，
+    因此对冲请求数不会超过主请求数的 ratio 倍，配额消耗有上限。
+    """
+
+    def __init__(self, ratio: float, burst: float = 10.0):
+        self.ratio = ratio
+        self.burst = burst
+        self._tokens = 0.0
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + self.ratio)
+
+    def try_spend(self) -> bool:
+        with self._lock:
+            if self._tokens >= 1.0:
+                self._tokens -= 1.0
+                return True
+            return False
+
+
+class HedgedRequester:
+    """按端点自适应阈值发送对冲请求"""
+
+    def __init__(self, percentile: float = 0.95, budget_ratio: float = 0.1,
+                 default_delay: float = 1.0, min_delay: float = 0.05,
+                 min_samples: int = 20, max_workers: int = 256, enabled: bool = True):
+        self.percentile = percentile
+        self.default_delay = default_delay
+        self.min_delay = min_delay
+        self.min_samples = min_samples
+        self.enabled = enabled
+        self.max_workers = max_workers
+        self.budget = HedgeBudget(budget_ratio)
+        # 已占用的线程池槽位；提交前先占槽位，保证任务提交后立即执行而不在队列中等待
+        self._in_flight = 0
+        self._trackers: Dict[str, LatencyTracker] = {}
+        self._counters: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix="hedge")
+
+    def _tracker(self, endpoint: str) -> LatencyTracker:
+        with self._lock:
+            if endpoint not in self._trackers:
+                self._trackers[endpoint] = LatencyTracker()
+                self._counters[endpoint] = {"requests": 0, "hedged": 0, "hedge_wins": 0}
+            return self._trackers[endpoint]
+
+    def _count(self, endpoint: str, name: str):
+        with self._lock:
+            self._counters[endpoint][name] += 1
+
+    def hedge_delay(self, endpoint: str) -> float:
+        """端点当前的对冲阈值：样本足够时取观测分位数，否则取默认值"""
+        tracker = self._tracker(endpoint)
+        if len(tracker) < self.min_samples:
+            return self.default_delay
+        return max(self.min_delay, tracker.percentile(self.percentile))
+
+    def _timed(self, endpoint: str, func: Callable[[], Any]) -> Any:
+        start = time.monotonic()
+        result = func()
+        self._tracker(endpoint).record(time.monotonic() - start)
+        return result
+
+    def _reserve(self) -> bool:
+        """占用一个线程池槽位，已满时返回False"""
+        with self._lock:
+            if self._in_flight >= self.max_workers:
+                return False
+            self._in_flight += 1
+            return True
+
+    def _release(self):
+        with self._lock:
+            self._in_flight -= 1
+
+    def _hedge_allowed(self, admit: Optional[Callable[[], bool]]) -> bool:
+        """对冲预算、线程池槽位、外部准入（如限流令牌）都满足时才对冲"""
+        if not self.budget.try_spend() or not self._reserve():
+            return False
+        if admit is not None and not admit():
+            self._release()
+            return False
+        return True
+
+    def _pooled(self, endpoint: str, func: Callable[[], Any]) -> Any:
+        try:
+            return self._timed(endpoint, func)
+        finally:
+            self._release()
+
+    def call(self, endpoint: str, func: Callable[[], Any], timeout: float = 10.0,
+             admit: Optional[Callable[[], bool]] = None) -> Any:
+        """
+        执行上游调用
+
+        Args:
+            endpoint: 端点名称（按端点分别统计耗时）
+            func: 实际发起请求的函数，需可安全重复调用
+            timeout: 总超时时间（秒）
+            admit: 发送对冲前调用（如限流器取令牌），返回False时不对冲
+        """
+        delay = self.hedge_delay(endpoint)
+        self._count(endpoint, "requests")
+        # 关闭对冲或线程池已满时在调用线程直接执行，并发不受线程池大小限制
+        if not self.enabled or not self._reserve():
+            return self._timed(endpoint, func)
+
+        self.budget.deposit()
+        deadline = time.monotonic() + timeout
+        primary = self._executor.submit(self._pooled, endpoint, func)
+        done, _ = wait([primary], timeout=min(delay, timeout))
+        if done or not self._hedge_allowed(admit):
+            try:
+                return primary.result(timeout=max(0.0, deadline - time.monotonic()))
+            except FuturesTimeoutError:
+                primary.cancel()
+                raise TimeoutError(f"{endpoint} 请求超时")
+
+        self._count(endpoint, "hedged")
+        hedge = self._executor.submit(self._pooled, endpoint, func)
+        pending = {primary, hedge}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    if future.exception() is None:
+                        if future is hedge:
+                            self._count(endpoint, "hedge_wins")
+                        return future.result()
+                    error = future.exception()
+        finally:
+            # 不再需要的请求：未开始的直接取消，已开始的由func自身的超时结束
+            for future in pending:
+                future.cancel()
+        if error is not None:
+            raise error
+        raise TimeoutError(f"{endpoint} 请求超时")
+
+    def stats(self) -> Dict[str, Any]:
+        """各端点的对冲统计"""
+        with self._lock:
+            endpoints = list(self._trackers)
+            counters = {name: dict(values) for name, values in self._counters.items()}
+        result = {}
+        for endpoint in endpoints:
+            tracker = self._trackers[endpoint]
+            p95 = tracker.percentile(0.95)
+            result[endpoint] = {
+                **counters[endpoint],
+                "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+                "hedge_delay_ms": round(self.hedge_delay(endpoint) * 1000, 1)
+            }
+        return result
+
+
+_requester: Optional[HedgedRequester] = None
+_requester_lock = threading.Lock()
+
+
+def get_requester() -> HedgedRequester:
+    """获取全局对冲请求器（同一进程内的所有MapService共用耗时统计与预算）"""
+    global _requester
+    if _requester is None:
+        with _requester_lock:
+            if _requester is None:
+                _requester = HedgedRequester(
+                    percentile=settings.hedge_percentile,
+                    budget_ratio=settings.hedge_budget_ratio,
+                    default_delay=settings.hedge_default_delay_seconds,
+                    max_workers=settings.hedge_max_workers,
+                    enabled=settings.hedge_enabled
+                )
+    return _requester
@@ -1,7 +1,36 @@
 """
 工具函数
 """
+import math
 import re
+from typing import Optional, Tuple
+
+
+# 坐标格式 "经度,纬度"：前者用于从任意文本中提取，后者要求整串就是坐标（允许空格、负号、全角逗号）
+COORD_PATTERN = re.compile(r'(\d+\.?\d*),(\d+\.?\d*)')
+STRICT_COORD_PATTERN = re.compile(r'^\s*(-?\d{1,3}(?:\.\d+)?)\s*[,，]\s*(-?\d{1,2}(?:\.\d+)?)\s*$')
+
+
+def parse_coordinates(location_str: str) -> Optional[Tuple[float, float]]:
+    """
+    严格识别整串为 "经度,纬度" 的输入
+    返回: (longitude, latitude)，不是坐标时返回None
+    """
+    match = STRICT_COORD_PATTERN.match(location_str)
+    if not match:
+        return None
+    lon, lat = float(match.group(1)), float(match.group(2))
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        return None
+    return lon, lat
+
+
+def haversine_distance(lon1: float, lat1: float, lon2: float, lat2: float) -> float:
+    """计算两点间的球面直线距离（米）"""
+    lon1, lat1, lon2, lat2 = map(math.radians, (lon1, lat1, lon2, lat2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2 +
+         math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * 6371000 * math.asin(math.sqrt(a))
 
 
 def parse_location_string(location_str: str) -> dict:
@@ -10,8 +39,7 @@ def parse_location_string(location_str: str) -> dict:
     返回: {"name": str, "longitude": float, "latitude": float, "address": str}
     """
     # 如果是坐标格式 "经度,纬度"
-    coord_pattern = r'(\d+\.?\d*),(\d+\.?\d*)'
-    match = re.search(coord_pattern, location_str)
+    match = COORD_PATTERN.search(location_str)
     if match:
         return {
             "longitude": float(match.group(1)),
@@ -0,0 +1,148 @@
+"""
+上游限流：按优先级分配令牌的令牌桶
+
+线上查询（live）只要桶里有令牌就可以取；后台任务（background，如缓存预热）
+只能使用高于保留量的令牌，并且有线上请求在等待时让行，保证预热不会挤占线上配额。
+当前线程的优先级用 background_priority() 上下文切换，调用路径与线上完全相同。
+"""
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+from src.config import settings
+
+
+LIVE = "live"
+BACKGROUND = "background"
+
+_local = threading.local()
+
+
+@contextmanager
+def background_priority():
+    """在该上下文内，当前线程发起的上游调用按后台优先级限流"""
+    previous = getattr(_local, "priority", LIVE)
+    _local.priority = BACKGROUND
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+def current_priority() -> str:
+    """当前线程的上游调用优先级"""
+    return getattr(_local, "priority", LIVE)
+
+
+class RateLimiter:
+    """
+    按优先级分配的令牌桶
+
+    Args:
+        rate: 每秒补充的令牌数，<=0 表示不限流
+        burst: 桶容量
+        background_reserve: 为线上请求保留的令牌数，后台任务不能动用
+    """
+
+    def __init__(self, rate: float, burst: int, background_reserve: float = 0.0):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.background_reserve = min(background_reserve, self.burst - 1)
+        self.tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._live_waiting = 0
+        self._cond = threading.Condition()
+        self.counters = {
+            priority: {"acquired": 0, "wait_seconds": 0.0}
+            for priority in (LIVE, BACKGROUND)
+        }
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(float(self.burst), self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, priority: Optional[str] = None) -> float:
+        """
+        取一个令牌，不足时阻塞等待
+
+        Args:
+            priority: live / background，默认取当前线程的优先级
+
+        Returns:
+            等待的秒数
+        """
+        if self.rate <= 0:
+            return 0.0
+        priority = priority or current_priority()
+        live = priority != BACKGROUND
+        started = time.monotonic()
+        with self._cond:
+            if live:
+                self._live_waiting += 1
+            try:
+                while True:
+                    self._refill()
+                    floor = 0.0 if live else self.background_reserve
+                    if self.tokens >= 1 + floor and (live or self._live_waiting == 0):
+                        self.tokens -= 1
+                        break
+                    # 令牌不足时等到补满为止；后台让行时由线上请求取完令牌后唤醒
+                    self._cond.wait(timeout=max((1 + floor - self.tokens) / self.rate, 0.005))
+            finally:
+                if live:
+                    self._live_waiting -= 1
+                    self._cond.notify_all()
+            waited = time.monotonic() - started
+            counters = self.counters[BACKGROUND if not live else LIVE]
+            counters["acquired"] += 1
+            counters["wait_seconds"] += waited
+        return waited
+
+    def try_acquire(self, priority: Optional[str] = None) -> bool:
+        """不等待地取一个令牌（用于对冲等可放弃的请求），取不到返回False"""
+        if self.rate <= 0:
+            return True
+        live = (priority or current_priority()) != BACKGROUND
+        with self._cond:
+            self._refill()
+            floor = 0.0 if live else self.background_reserve
+            if self.tokens < 1 + floor or (not live and self._live_waiting > 0):
+                return False
+            self.tokens -= 1
+            self.counters[LIVE if live else BACKGROUND]["acquired"] += 1
+            return True
+
+    def stats(self) -> Dict:
+        with self._cond:
+            self._refill()
+            return {
+                "rate": self.rate,
+                "burst": self.burst,
+                "tokens": round(self.tokens, 2),
+                **{
+                    priority: {
+                        "acquired": counters["acquired"],
+                        "wait_seconds": round(counters["wait_seconds"], 3)
+                    }
+                    for priority, counters in self.counters.items()
+                }
+            }
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """获取全局上游限流器（同一进程内的所有MapService共用）"""
+    global _limiter
+    if _limiter is None:
+        with _limiter_lock:
+            if _limiter is None:
+                _limiter = RateLimiter(
+                    rate=settings.upstream_rate_limit,
+                    burst=settings.upstream_burst,
+                    background_reserve=settings.upstream_burst * settings.background_reserve_ratio
+                )
+    return _limiter
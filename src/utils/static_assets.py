@@ -0,0 +1,115 @@
+"""
+静态资源：启动时预压缩并常驻内存，带强ETag与Cache-Control
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+from typing import Dict, List, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:  # requirements.txt中已包含；环境缺少时退化为只提供gzip
+    brotli = None
+
+
+# 需要预压缩的文本类型与最小体积（字节）
+COMPRESSIBLE_EXTENSIONS = {".html", ".js", ".css", ".json", ".svg", ".txt"}
+MIN_COMPRESS_SIZE = 256
+
+# 缓存策略：页面每次都要协商（配合ETag返回304），其他资源可缓存一小时
+HTML_CACHE_CONTROL = "no-cache"
+DEFAULT_CACHE_CONTROL = "public, max-age=3600"
+
+
+class StaticAsset:
+    """单个静态资源的各编码版本"""
+
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            content = f.read()
+        extension = os.path.splitext(path)[1].lower()
+        media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        if media_type.startswith("text/") or extension in (".js", ".json", ".svg"):
+            media_type += "; charset=utf-8"
+        self.media_type = media_type
+        self.cache_control = HTML_CACHE_CONTROL if extension == ".html" else DEFAULT_CACHE_CONTROL
+
+        digest = hashlib.sha256(content).hexdigest()[:32]
+        # 编码 -> (内容, 强ETag)；不同编码是不同的表示，ETag必须不同
+        self.variants: Dict[str, Tuple[bytes, str]] = {"identity": (content, f'"{digest}"')}
+        if extension in COMPRESSIBLE_EXTENSIONS and len(content) >= MIN_COMPRESS_SIZE:
+            self.variants["gzip"] = (gzip.compress(content, compresslevel=9, mtime=0),
+                                     f'"{digest}-gz"')
+            if brotli is not None:
+                self.variants["br"] = (brotli.compress(content, quality=11),
+                                       f'"{digest}-br"')
+
+    def choose_encoding(self, accept_encoding: str) -> str:
+        """按Accept-Encoding选择编码：优先br，其次gzip，最后不压缩"""
+        accepted = _parse_accept_encoding(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accepted.get(encoding, accepted.get("*", 0)) > 0:
+                return encoding
+        return "identity"
+
+    def response(self, request: Request) -> Response:
+        """生成响应，If-None-Match命中时返回304；HEAD请求只返回与GET相同的头"""
+        encoding = self.choose_encoding(request.headers.get("accept-encoding", ""))
+        content, etag = self.variants[encoding]
+        headers = {
+            "ETag": etag,
+            "Cache-Control": self.cache_control,
+            "Vary": "Accept-Encoding"
+        }
+        if _etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if request.method == "HEAD":
+            headers["Content-Length"] = str(len(content))
+            return Response(media_type=self.media_type, headers=headers)
+        return Response(content=content, media_type=self.media_type, headers=headers)
+
+
+def _parse_accept_encoding(header: str) -> Dict[str, float]:
+    """解析Accept-Encoding，返回 {编码: q值}"""
+    accepted = {}
+    for part in header.split(","):
+        fields = part.strip().split(";")
+        name = fields[0].strip().lower()
+        if not name:
+            continue
+        quality = 1.0
+        for param in fields[1:]:
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        accepted[name] = quality
+    return accepted
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match使用弱比较（忽略W/前缀）"""
+    if not if_none_match:
+        return False
+    candidates: List[str] = [tag.strip() for tag in if_none_match.split(",")]
+    return any(tag == "*" or (tag[2:] if tag.startswith("W/") else tag) == etag
+               for tag in candidates)
+
+
+def load_assets(static_dir: str) -> Dict[str, StaticAsset]:
+    """加载静态目录顶层的所有文件"""
+    assets = {}
+    if not os.path.isdir(static_dir):
+        return assets
+    for name in sorted(os.listdir(static_dir)):
+        path = os.path.join(static_dir, name)
+        if os.path.isfile(path):
+            assets[name] = StaticAsset(path)
+    return assets
@@ -1,11 +1,33 @@
 """
 启动Web服务器
+
+用法：
+    python start_server.py                  # 开发模式：单worker，代码修改自动重载
+    python start_server.py --workers 4      # 生产模式：多worker，共享SQLite缓存
 """
+import argparse
 import uvicorn
 import os
 import sys
 
+
+def parse_args():
+    """解析命令行参数"""
+    parser = argparse.ArgumentParser(description="目的地自主决策智能体Web服务")
+    parser.add_argument("--host", default="0.0.0.0", help="监听地址")
+    parser.add_argument("--port", type=int, default=8000, help="监听端口")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker进程数，大于1时进入生产模式（关闭自动重载）")
+    parser.add_argument("--cache-backend", choices=["memory", "sqlite"], default=None,
+                        help="缓存后端，多worker时默认sqlite（跨进程共享）")
+    parser.add_argument("--cache-path", default=None, help="SQLite缓存文件路径")
+    return parser.parse_args()
+
+
 if __name__ == "__main__":
+    args = parse_args()
+    production = args.workers > 1
+
     # 检查.env文件
     env_file = os.path.join(os.path.dirname(__file__), ".env")
     if not os.path.exists(env_file):
@@ -13,17 +35,26 @@ if __name__ == "__main__":
         print("请创建.env文件并配置AMAP_API_KEY")
         print("示例：AMAP_API_KEY=你的高德地图API_Key")
         print("\n继续启动服务器...\n")
-    
+
+    # 缓存配置通过环境变量传给各worker进程
+    cache_backend = args.cache_backend or ("sqlite" if production else None)
+    if cache_backend:
+        os.environ["CACHE_BACKEND"] = cache_backend
+    if args.cache_path:
+        os.environ["CACHE_PATH"] = args.cache_path
+
     # 启动服务器
     print("🚀 启动目的地自主决策智能体Web服务...")
-    print("📱 访问地址: http://localhost:8000")
+    print(f"📱 访问地址: http://localhost:{args.port}")
+    if production:
+        print(f"⚙️  生产模式：{args.workers}个worker，缓存后端：{cache_backend}")
     print("按 Ctrl+C 停止服务\n")
-    
+
     uvicorn.run(
         "src.api:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,  # 开发模式，代码修改自动重载
+        host=args.host,
+        port=args.port,
+        reload=not production,  # 开发模式，代码修改自动重载
+        workers=args.workers,
         log_level="info"
     )
-